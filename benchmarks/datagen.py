@@ -0,0 +1,128 @@
+import argparse
+import os
+import time
+from typing import Dict
+
+import psycopg2
+from dotenv import load_dotenv
+
+from benchmarks.fake_hh_server import RATES
+from modules.db_module import DBManager
+
+TITLES = ['Python разработчик', 'Java developer', 'Аналитик данных', 'DevOps инженер', 'Тестировщик',
+          'Frontend developer', 'Менеджер проекта', 'Data Engineer']
+VACANCIES_PER_COMPANY = 100
+
+
+def create_bench_database(db_name: str) -> None:
+    """
+    Создает отдельную базу для бенчмарков, чтобы не затрагивать рабочие данные
+    """
+    conn = psycopg2.connect(
+        dbname='postgres',
+        user=os.getenv('DB_USER'),
+        password=os.getenv('DB_PASSWORD'),
+        host=os.getenv('DB_HOST'),
+        port=os.getenv('DB_PORT', '5432')
+    )
+    conn.autocommit = True
+    with conn.cursor() as cur:
+        cur.execute('SELECT 1 FROM pg_database WHERE datname = %s;', (db_name,))
+        if cur.fetchone() is None:
+            cur.execute(f'CREATE DATABASE {db_name};')
+    conn.close()
+
+
+def bench_db_params(db_name: str) -> Dict:
+    """
+    Параметры DBManager для базы бенчмарков
+    """
+    return {
+        'db_name': db_name,
+        'user': os.getenv('DB_USER', ''),
+        'password': os.getenv('DB_PASSWORD', ''),
+        'host': os.getenv('DB_HOST', 'localhost'),
+        'port': int(os.getenv('DB_PORT', 5432)),
+    }
+
+
+def connect(db_name: str) -> DBManager:
+    """
+    Подключается к базе бенчмарков и применяет миграции
+    """
+    create_bench_database(db_name)
+    db_manager = DBManager(**bench_db_params(db_name))
+    db_manager.create_tables()
+    return db_manager
+
+
+def reset(db_manager: DBManager) -> None:
+    """
+    Очищает таблицы с данными
+    """
+    with db_manager._cursor() as cur:
+        cur.execute('TRUNCATE vacancy_history, ingest_jobs, sync_state, vacancies, companies;')
+
+
+def seed(db_manager: DBManager, rows: int, seed_value: float = 0.42) -> float:
+    """
+    Заполняет базу синтетическими вакансиями средствами самого Postgres (generate_series),
+    без передачи строк через Python. Возвращает время заполнения в секундах
+    """
+    companies = max(1, rows // VACANCIES_PER_COMPANY)
+    started = time.perf_counter()
+    reset(db_manager)
+    db_manager.update_exchange_rates(RATES)
+    with db_manager._transaction() as cur:
+        cur.execute('SELECT setseed(%s);', (seed_value,))
+        cur.execute('''
+        INSERT INTO companies (company_id, name, url)
+        SELECT g, 'Компания ' || g, 'https://hh.ru/employer/' || g
+        FROM generate_series(1, %s) AS g;
+        ''', (companies,))
+        cur.execute('''
+        INSERT INTO vacancies (vacancy_id, company_id, name, description, url, salary_from, salary_to,
+                               salary_currency, city, experience, employment, schedule, published_at, content_hash)
+        SELECT g,
+               1 + g %% %(companies)s,
+               (%(titles)s::text[])[1 + g %% array_length(%(titles)s::text[], 1)] || ' ' || g,
+               'Описание вакансии ' || g,
+               'https://hh.ru/vacancy/' || g,
+               s.salary_from,
+               CASE WHEN random() < 0.3 THEN NULL
+                    ELSE COALESCE(s.salary_from, 50000) + round(random() * 100) * 1000 END,
+               (ARRAY['RUR', 'RUR', 'RUR', 'USD', 'EUR', 'KZT'])[1 + g %% 6],
+               (ARRAY['Москва', 'Санкт-Петербург', 'Казань', 'Алматы'])[1 + g %% 4],
+               (ARRAY['Нет опыта', 'От 1 года до 3 лет', 'От 3 до 6 лет', 'Более 6 лет'])[1 + g %% 4],
+               'Полная занятость',
+               'Полный день',
+               now() - (g %% 365) * interval '1 day',
+               md5(g::text)
+        FROM generate_series(1, %(rows)s) AS g
+        CROSS JOIN LATERAL (
+            SELECT CASE WHEN random() < 0.3 THEN NULL ELSE round(30 + random() * 270) * 1000 END + g * 0 AS salary_from
+        ) AS s;
+        ''', {'companies': companies, 'titles': TITLES, 'rows': rows})
+        cur.execute('ANALYZE companies; ANALYZE vacancies;')
+    db_manager.refresh_rollups()
+    return time.perf_counter() - started
+
+
+def main() -> None:
+    """
+    Запуск из командной строки: python -m benchmarks.datagen --rows 100000
+    """
+    load_dotenv()
+    parser = argparse.ArgumentParser(description='Заполнение базы бенчмарков синтетическими вакансиями')
+    parser.add_argument('--rows', type=int, default=10000)
+    parser.add_argument('--db-name', default=os.getenv('BENCH_DB_NAME', 'vacancy_bench'))
+    args = parser.parse_args()
+
+    db_manager = connect(args.db_name)
+    elapsed = seed(db_manager, args.rows)
+    print(f"База {args.db_name} заполнена: {args.rows} вакансий за {elapsed:.2f} с")
+    db_manager.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,212 @@
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+
+TITLES = ['Python разработчик', 'Java developer', 'Аналитик данных', 'DevOps инженер', 'Тестировщик',
+          'Frontend developer', 'Менеджер проекта', 'Data Engineer']
+CURRENCIES = ['RUR', 'RUR', 'RUR', 'USD', 'EUR', 'KZT']
+RATES = {'RUR': 1.0, 'USD': 0.0125, 'EUR': 0.0108, 'KZT': 6.2}
+CITIES = ['Москва', 'Санкт-Петербург', 'Новосибирск', 'Казань', 'Алматы']
+
+
+class FakeHHServer:
+    """
+    Локальная замена api.hh.ru с синтетическими данными, настраиваемой задержкой и ответами 429
+    """
+
+    def __init__(
+            self,
+            employers: int = 10,
+            vacancies_per_employer: int = 200,
+            latency: float = 0.0,
+            error_rate: float = 0.0,
+            retry_after: int = 1,
+            host: str = '127.0.0.1',
+            port: int = 0,
+            seed: int = 42
+    ) -> None:
+        """
+        latency - задержка каждого ответа в секундах, error_rate - доля запросов, получающих 429
+        с заголовком Retry-After, port=0 - выбрать свободный порт
+        """
+        self.employer_ids: List[int] = list(range(1, employers + 1))
+        self.vacancies_per_employer: int = vacancies_per_employer
+        self.latency: float = latency
+        self.error_rate: float = error_rate
+        self.retry_after: int = retry_after
+        self.stats: Dict[str, int] = {'requests': 0, 'throttled': 0}
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.host: str = host
+        self._server = ThreadingHTTPServer((host, port), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        """
+        Адрес сервера для APIClient(base_url=...)
+        """
+        return f"http://{self.host}:{self._server.server_port}"
+
+    def vacancy(self, vacancy_id: int) -> Dict:
+        """
+        Синтетическая вакансия: содержимое детерминированно зависит от id
+        """
+        rnd = random.Random(vacancy_id)
+        employer_id = (vacancy_id - 1) // self.vacancies_per_employer + 1
+        salary_from: Optional[int] = rnd.choice([None, rnd.randrange(30, 300) * 1000])
+        salary_to: Optional[int] = rnd.choice([None, (salary_from or 50000) + rnd.randrange(10, 100) * 1000])
+        return {
+            'id': str(vacancy_id),
+            'name': f"{rnd.choice(TITLES)} {vacancy_id}",
+            'employer': {'id': str(employer_id), 'name': f"Компания {employer_id}"},
+            'salary': {'from': salary_from, 'to': salary_to, 'currency': rnd.choice(CURRENCIES)}
+            if salary_from or salary_to else None,
+            'alternate_url': f"https://hh.ru/vacancy/{vacancy_id}",
+            'published_at': '2026-01-01T10:00:00+0300',
+            'area': {'name': rnd.choice(CITIES)},
+        }
+
+    def _employer_vacancy_ids(self, employer_id: int) -> range:
+        """
+        Диапазон id вакансий работодателя
+        """
+        first = (employer_id - 1) * self.vacancies_per_employer + 1
+        return range(first, first + self.vacancies_per_employer)
+
+    def _route(self, url: str) -> Tuple[int, Optional[Dict]]:
+        """
+        Формирует ответ на GET запрос: (статус, тело)
+        """
+        parsed = urlparse(url)
+        query = {key: values[0] for key, values in parse_qs(parsed.query).items()}
+        parts = [part for part in parsed.path.split('/') if part]
+
+        if len(parts) == 2 and parts[0] == 'employers':
+            employer_id = int(parts[1])
+            if employer_id not in self.employer_ids:
+                return 404, None
+            return 200, {
+                'id': str(employer_id),
+                'name': f"Компания {employer_id}",
+                'alternate_url': f"https://hh.ru/employer/{employer_id}",
+                'open_vacancies': self.vacancies_per_employer,
+            }
+
+        if parts == ['vacancies']:
+            employer_id = int(query.get('employer_id', 0))
+            ids = self._employer_vacancy_ids(employer_id) if employer_id in self.employer_ids else range(0)
+            if 'date_from' in query:
+                ids = range(0)
+            per_page = int(query.get('per_page', 20))
+            page = int(query.get('page', 0))
+            page_ids = ids[page * per_page:(page + 1) * per_page]
+            return 200, {
+                'items': [self.vacancy(vacancy_id) for vacancy_id in page_ids],
+                'found': len(ids),
+                'pages': (len(ids) + per_page - 1) // per_page,
+                'page': page,
+                'per_page': per_page,
+            }
+
+        if parts == ['dictionaries']:
+            return 200, {'currency': [{'code': code, 'rate': rate} for code, rate in RATES.items()]}
+
+        if len(parts) == 2 and parts[0] == 'vacancies':
+            vacancy = self.vacancy(int(parts[1]))
+            vacancy.update({
+                'description': f"<p>Описание вакансии <b>{vacancy['name']}</b></p>",
+                'experience': {'name': 'От 1 года до 3 лет'},
+                'employment': {'name': 'Полная занятость'},
+                'schedule': {'name': 'Полный день'},
+            })
+            return 200, vacancy
+
+        return 404, None
+
+    def _handler_class(self) -> type:
+        """
+        Класс обработчика запросов, привязанный к этому серверу
+        """
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self) -> None:
+                if server.latency:
+                    time.sleep(server.latency)
+                with server._lock:
+                    server.stats['requests'] += 1
+                    throttled = server._random.random() < server.error_rate
+                    if throttled:
+                        server.stats['throttled'] += 1
+                body: Optional[Dict]
+                if throttled:
+                    status, body = 429, {'errors': [{'type': 'too_many_requests'}]}
+                else:
+                    status, body = server._route(self.path)
+                payload = json.dumps(body if body is not None else {}).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(payload)))
+                if throttled:
+                    self.send_header('Retry-After', str(server.retry_after))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, format: str, *args: object) -> None:
+                pass
+
+        return Handler
+
+    def start(self) -> 'FakeHHServer':
+        """
+        Запускает сервер в фоновом потоке
+        """
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        """
+        Останавливает сервер
+        """
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self) -> 'FakeHHServer':
+        return self.start()
+
+    def __exit__(self, *args: object) -> None:
+        self.stop()
+
+
+def main() -> None:
+    """
+    Запуск сервера из командной строки: python -m benchmarks.fake_hh_server --port 8000
+    """
+    parser = argparse.ArgumentParser(description='Локальная замена api.hh.ru для бенчмарков')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--employers', type=int, default=10)
+    parser.add_argument('--vacancies', type=int, default=200, help='вакансий на работодателя')
+    parser.add_argument('--latency', type=float, default=0.0, help='задержка ответа, с')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='доля ответов 429')
+    args = parser.parse_args()
+
+    server = FakeHHServer(args.employers, args.vacancies, args.latency, args.error_rate, port=args.port)
+    print(f"Сервер запущен: {server.base_url} (работодатели 1..{args.employers})")
+    try:
+        server._server.serve_forever()
+    except KeyboardInterrupt:
+        server._server.server_close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,203 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional
+from unittest import mock
+
+from dotenv import load_dotenv
+
+from benchmarks.datagen import bench_db_params, connect, reset, seed
+from benchmarks.fake_hh_server import FakeHHServer
+from modules.api_module import APIClient
+from modules.db_module import DBManager, format_salary
+from modules.salary_module import SalaryAnalytics
+
+
+def measure(name: str, func: Callable[[], object], repeat: int, dataset_rows: Optional[int] = None) -> Dict:
+    """
+    Выполняет функцию repeat раз и возвращает статистику времени выполнения
+    """
+    timings: List[float] = []
+    result: object = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = func()
+        timings.append(time.perf_counter() - started)
+    timings.sort()
+    rows = len(result) if isinstance(result, (list, tuple)) else None
+    record: Dict[str, Any] = {
+        'name': name,
+        'dataset_rows': dataset_rows,
+        'runs': repeat,
+        'min_s': timings[0],
+        'median_s': statistics.median(timings),
+        'p95_s': timings[min(len(timings) - 1, int(len(timings) * 0.95))],
+        'result_rows': rows,
+    }
+    print(f"{name:<45} rows={dataset_rows!s:<8} median={record['median_s'] * 1000:10.2f} мс")
+    return record
+
+
+def bench_ingest(
+        db_manager: DBManager,
+        db_params: Dict,
+        employers: int,
+        vacancies: int,
+        latency: float,
+        error_rate: float
+) -> Dict:
+    """
+    Замеряет полную синхронизацию sync_data против локального сервера hh. db_params - параметры
+    той же базы, что и db_manager, для процессов загрузки при INGEST_PROCESSES > 1
+    """
+    from main import sync_data
+
+    with FakeHHServer(employers, vacancies, latency=latency, error_rate=error_rate) as server:
+        api_client = APIClient(
+            base_url=server.base_url,
+            max_workers=int(os.getenv('API_WORKERS', 4)),
+            rate_limit=float(os.getenv('BENCH_RATE_LIMIT', 1000)),
+            burst=50,
+            backoff_base=0.05
+        )
+        reset(db_manager)
+        try:
+            with contextlib.redirect_stdout(io.StringIO()):
+                record = measure(
+                    'sync_data',
+                    lambda: sync_data(db_manager, full=True, client=api_client, company_ids=server.employer_ids,
+                                      db_params=db_params),
+                    1,
+                    employers * vacancies
+                )
+        finally:
+            api_client.close()
+        record.update({
+            'latency_s': latency,
+            'error_rate': error_rate,
+            'api_stats': dict(api_client.stats),
+            'server_stats': dict(server.stats),
+        })
+        return record
+
+
+def bench_queries(db_manager: DBManager, rows: int, repeat: int, keyword: str) -> List[Dict]:
+    """
+    Замеряет все читающие методы DBManager и путь форматирования на заполненной базе
+    """
+    from main import show_vacancies_pages
+
+    results = [
+        measure('get_avg_salary', db_manager.get_avg_salary, repeat, rows),
+        measure('get_companies_and_vacancies_count', db_manager.get_companies_and_vacancies_count, repeat, rows),
+        measure('get_all_vacancies', db_manager.get_all_vacancies, max(1, repeat // 5), rows),
+        measure('get_vacancies_with_higher_salary', db_manager.get_vacancies_with_higher_salary,
+                max(1, repeat // 5), rows),
+        measure('get_vacancies_with_keyword', lambda: db_manager.get_vacancies_with_keyword(keyword), repeat, rows),
+        measure('get_vacancies_with_keyword_top20',
+                lambda: db_manager.get_vacancies_with_keyword(keyword, limit=20), repeat, rows),
+        measure('get_all_vacancies_page', lambda: db_manager.get_all_vacancies_page(after_id=rows // 2), repeat, rows),
+        measure('get_vacancies_with_higher_salary_page', db_manager.get_vacancies_with_higher_salary_page,
+                repeat, rows),
+        measure('get_vacancies_with_keyword_page',
+                lambda: db_manager.get_vacancies_with_keyword_page(keyword), repeat, rows),
+        measure('iter_all_vacancies', lambda: sum(1 for _ in db_manager.iter_all_vacancies()),
+                max(1, repeat // 5), rows),
+        measure('refresh_rollups', db_manager.refresh_rollups, max(1, repeat // 5), rows),
+        measure('salary_distribution', SalaryAnalytics(db_manager).distribution, max(1, repeat // 5), rows),
+        measure('salary_histogram', SalaryAnalytics(db_manager).histogram, max(1, repeat // 5), rows),
+    ]
+
+    # форматирование зарплаты в строках списков вакансий
+    salaries = [(float(i * 1000), None if i % 3 else float(i * 2000)) for i in range(100000)]
+    results.append(measure(
+        'format_salary_100k', lambda: [format_salary(*pair) for pair in salaries], repeat, None
+    ))
+
+    def render_first_page() -> None:
+        with contextlib.redirect_stdout(io.StringIO()):
+            show_vacancies_pages(db_manager.get_all_vacancies_page, '', '')
+
+    # меню ждет ввода после первой страницы - отвечаем 'q'
+    with mock.patch('builtins.input', return_value='q'):
+        results.append(measure('show_vacancies_pages_first_page', render_first_page, repeat, rows))
+    return results
+
+
+def compare(results: List[Dict], baseline_path: str, threshold: float) -> List[str]:
+    """
+    Сравнивает медианы с сохраненным прогоном и возвращает список регрессий
+    """
+    with open(baseline_path, encoding='utf-8') as f:
+        baseline = {(r['name'], r['dataset_rows']): r for r in json.load(f)['results']}
+    regressions = []
+    for record in results:
+        previous = baseline.get((record['name'], record['dataset_rows']))
+        if previous and previous['median_s'] > 0 and record['median_s'] > previous['median_s'] * threshold:
+            regressions.append(
+                f"{record['name']} (rows={record['dataset_rows']}): "
+                f"{previous['median_s'] * 1000:.2f} мс -> {record['median_s'] * 1000:.2f} мс"
+            )
+    return regressions
+
+
+def main() -> None:
+    """
+    Запуск: python -m benchmarks.run --sizes 10000,100000 --output bench_results.json
+    """
+    load_dotenv()
+    parser = argparse.ArgumentParser(description='Бенчмарки загрузки и запросов без доступа к api.hh.ru')
+    parser.add_argument('--db-name', default=os.getenv('BENCH_DB_NAME', 'vacancy_bench'))
+    parser.add_argument('--sizes', default='10000,100000,1000000', help='размеры наборов данных через запятую')
+    parser.add_argument('--repeat', type=int, default=10)
+    parser.add_argument('--keyword', default='python')
+    parser.add_argument('--employers', type=int, default=20)
+    parser.add_argument('--vacancies', type=int, default=500, help='вакансий на работодателя при загрузке')
+    parser.add_argument('--latency', type=float, default=0.02)
+    parser.add_argument('--error-rate', type=float, default=0.05)
+    parser.add_argument('--skip-ingest', action='store_true')
+    parser.add_argument('--output', default='bench_results.json')
+    parser.add_argument('--compare', help='файл прошлого прогона для поиска регрессий')
+    parser.add_argument('--threshold', type=float, default=1.25, help='допустимый рост медианы')
+    args = parser.parse_args()
+
+    db_manager = connect(args.db_name)
+    results: List[Dict] = []
+    if not args.skip_ingest:
+        results.append(bench_ingest(
+            db_manager, bench_db_params(args.db_name), args.employers, args.vacancies, args.latency, args.error_rate
+        ))
+
+    for size in (int(value) for value in args.sizes.split(',') if value):
+        print(f"Заполняем базу: {size} вакансий...")
+        results.append(measure('seed', lambda: seed(db_manager, size), 1, size))
+        results.extend(bench_queries(db_manager, size, args.repeat, args.keyword))
+    db_manager.close()
+
+    report = {
+        'created_at': datetime.now(timezone.utc).isoformat(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'results': results,
+    }
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"Результаты сохранены в {args.output}")
+
+    if args.compare:
+        regressions = compare(results, args.compare, args.threshold)
+        for line in regressions:
+            print(f"Регрессия: {line}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
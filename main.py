@@ -1,16 +1,59 @@
+import argparse
 import os
-from typing import Dict, List, Optional, Tuple
+import sys
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Dict, List, Optional, Tuple, TypeVar
 
 import psycopg2
 from dotenv import load_dotenv
 
 from modules.api_module import APIClient
-from modules.db_module import DBManager
+from modules.cache_module import ResponseCache
+from modules.db_module import DBManager, VacancyReader
+from modules.enrichment_module import VacancyEnricher
+from modules.export_module import FORMATS, VacancyExporter
+from modules.history_module import TREND_BUCKETS, HistoryManager
+from modules.jobs_module import IngestJobRunner, load_company_ids
+from modules.metrics_module import Metrics
+from modules.salary_module import DIMENSIONS, PERCENTILES, SalaryAnalytics, update_exchange_rates
+from modules.snapshot_module import SnapshotDB, create_snapshot
+from modules.sync_module import SyncEngine
 
 load_dotenv()
 
+PAGE_SIZE = 20
+# Команды, которые можно выполнить и по снимку базы
+READ_COMMANDS = ('avg-salary', 'search', 'companies')
+PageKey = TypeVar('PageKey')
+SYNC_FRESHNESS_MINUTES = float(os.getenv('SYNC_FRESHNESS_MINUTES', 60))
+HISTORY_RETENTION_MONTHS = int(os.getenv('HISTORY_RETENTION_MONTHS', 24))
 COMPANY_IDS = [205, 947, 871, 581458, 50697, 3749818, 3767717, 28250, 3464728, 2443495]
-api_client = APIClient()
+if os.getenv('COMPANY_IDS_FILE'):
+    COMPANY_IDS = load_company_ids(os.environ['COMPANY_IDS_FILE'])
+METRICS_PROMETHEUS_PATH = os.getenv('METRICS_PROMETHEUS_PATH')
+METRICS_JSON_PATH = os.getenv('METRICS_JSON_PATH')
+SLOW_QUERY_MS = os.getenv('SLOW_QUERY_MS')
+metrics: Optional[Metrics] = None
+if METRICS_PROMETHEUS_PATH or METRICS_JSON_PATH or SLOW_QUERY_MS:
+    metrics = Metrics(slow_query_threshold=float(SLOW_QUERY_MS) / 1000 if SLOW_QUERY_MS else None)
+    metrics.export_at_exit(METRICS_PROMETHEUS_PATH, METRICS_JSON_PATH)
+
+API_CACHE_PATH = os.getenv('API_CACHE_PATH', '.hh_cache.sqlite')
+
+
+def create_api_client() -> APIClient:
+    """
+    Клиент API hh по настройкам окружения. Создается только для синхронизации, чтобы команды чтения
+    не открывали файл кэша ответов
+    """
+    return APIClient(
+        base_url=os.getenv('HH_API_URL', 'https://api.hh.ru'),
+        max_workers=int(os.getenv('API_WORKERS', 4)),
+        rate_limit=float(os.getenv('API_RATE_LIMIT', 5)),
+        cache=ResponseCache(API_CACHE_PATH, max_bytes=int(os.getenv('API_CACHE_MAX_MB', 100)) * 1024 * 1024)
+        if API_CACHE_PATH else None,
+        metrics=metrics
+    )
 
 
 def create_database_if_not_exists() -> None:
@@ -44,45 +87,50 @@ def create_database_if_not_exists() -> None:
         print(f"Ошибка: {e}")
 
 
-def format_salary(salary_from: Optional[str], salary_to: Optional[str]) -> str:
+def get_db_params() -> Dict:
     """
-    Форматер строкового отобраджения
+    Параметры подключения DBManager из окружения
     """
-    try:
-        from_value: Optional[float] = float(salary_from) if salary_from is not None else None
-        to_value: Optional[float] = float(salary_to) if salary_to is not None else None
-    except (TypeError, ValueError):
-        return "Зарплата не указана"
-
-    if from_value and to_value:
-        return f"от {from_value} до {to_value}"
-    elif from_value:
-        return f"от {from_value}"
-    elif to_value:
-        return f"до {to_value}"
-    else:
-        return "Зарплата не указана"
+    return {
+        'db_name': 'vacancy',
+        'user': os.getenv('DB_USER'),
+        'password': os.getenv('DB_PASSWORD'),
+        'host': os.getenv('DB_HOST'),
+        'port': int(os.getenv('DB_PORT', 5432))
+    }
 
 
-def initialize_database(db_manager: DBManager) -> None:
+def show_vacancies_pages(
+        fetch_page: Callable[[Optional[PageKey], int], List[Tuple[PageKey, str, str, str, str]]],
+        title: str,
+        empty_message: str,
+        page_size: int = PAGE_SIZE
+) -> None:
     """
-    Создает таблицы и заполняет их данными о компаниях и вакансиях
+    Постранично выводит вакансии, запрашивая у базы следующую страницу только по команде пользователя.
+    Первый элемент строки страницы - ключ, после которого запрашивается следующая страница
     """
-    print("Создаем таблицы...")
-    db_manager.create_tables()
-
-    print("Загружаем данные о компаниях...")
-    companies_data: List[Dict] = api_client.get_companies(COMPANY_IDS)
-
-    for company in companies_data:
-        db_manager.insert_company(company)
-
-    for company in companies_data:
-        company_id: int = company['id']
-        print(f"Загружаем вакансии для компании {company['name']} (ID: {company_id})...")
-        vacancies: List[Dict] = api_client.get_vacancies_for_company(company_id)
-        for vacancy in vacancies:
-            db_manager.insert_vacancy(vacancy)
+    after: Optional[PageKey] = None
+    shown = 0
+    while True:
+        page = fetch_page(after, page_size)
+        if not page:
+            if not shown:
+                print(empty_message)
+            return
+        if not shown:
+            print(title)
+        for _, company_name, vacancy_name, salary_range, url in page:
+            print(
+                f"Компания: {company_name}\nВакансия: {vacancy_name}\nЗарплата:"
+                f" {salary_range}\nПодробнее: {url}\n"
+            )
+        shown += len(page)
+        after = page[-1][0]
+        if len(page) < page_size:
+            return
+        if input(f"Показано {shown}. Enter - следующая страница, q - вернуться в меню: ").strip().lower() == 'q':
+            return
 
 
 def user_interaction(db_manager: DBManager) -> None:
@@ -101,69 +149,33 @@ def user_interaction(db_manager: DBManager) -> None:
         choice: str = input("Введите номер действия (1-6): ")
 
         if choice == '1':
-            vacancies: List[Tuple] = db_manager.get_all_vacancies()
-            if vacancies:
-                print("\nВсе вакансии:")
-                for row in vacancies:
-                    if len(row) >= 6:
-                        company_name = row[0]
-                        vacancy_name = row[1]
-                        salary_range = format_salary(row[2], row[3])
-                        url = row[5]
-                        print(
-                            f"Компания: {company_name}\nВакансия: {vacancy_name}\nЗарплата:"
-                            f" {salary_range}\nПодробнее: {url}\n"
-                        )
-                    else:
-                        print(f"Данные о вакансии: {row}")
-            else:
-                print("Нет данных о вакансиях.")
+            show_vacancies_pages(
+                db_manager.get_all_vacancies_page,
+                "\nВсе вакансии:",
+                "Нет данных о вакансиях."
+            )
 
         elif choice == '2':
             avg_salary: Optional[float] = db_manager.get_avg_salary()
             if avg_salary is not None:
-                print(f"\nСредняя зарплата по вакансиям составляет: {avg_salary:.2f}")
+                print(f"\nСредняя зарплата по вакансиям составляет: {avg_salary:.2f} руб.")
             else:
                 print("Нет данных для расчета средней зарплаты.")
 
         elif choice == '3':
-            vacancies = db_manager.get_vacancies_with_higher_salary()
-            if vacancies:
-                print("\nВакансии с зарплатой выше средней:")
-                for row in vacancies:
-                    if len(row) >= 6:
-                        company_name = row[0]
-                        vacancy_name = row[1]
-                        salary_range = format_salary(row[2], row[3])
-                        url = row[5]
-                        print(
-                            f"Компания: {company_name}\nВакансия: {vacancy_name}\nЗарплата:"
-                            f" {salary_range}\nПодробнее: {url}\n"
-                        )
-                    else:
-                        print(f"Данные о вакансии неполные: {row}")
-            else:
-                print("Нет вакансий с зарплатой выше средней или данных нет.")
+            show_vacancies_pages(
+                db_manager.get_vacancies_with_higher_salary_page,
+                "\nВакансии с зарплатой выше средней:",
+                "Нет вакансий с зарплатой выше средней или данных нет."
+            )
 
         elif choice == '4':
             keyword: str = input("Введите ключевое слово для поиска вакансий: ")
-            vacancies = db_manager.get_vacancies_with_keyword(keyword)
-            if vacancies:
-                print(f"\nВакансии содержащие слово '{keyword}':")
-                for row in vacancies:
-                    if len(row) >= 6:
-                        company_name = row[0]
-                        vacancy_name = row[1]
-                        salary_range = format_salary(row[2], row[3])
-                        url = row[5]
-                        print(
-                            f"Компания: {company_name}\nВакансия: {vacancy_name}\nЗарплата:"
-                            f" {salary_range}\nПодробнее: {url}\n"
-                        )
-                    else:
-                        print(f"Данные о вакансии: {row}")
-            else:
-                print(f"Вакансий по ключевому слову '{keyword}' не найдено.")
+            show_vacancies_pages(
+                lambda after, limit: db_manager.get_vacancies_with_keyword_page(keyword, after, limit),
+                f"\nВакансии содержащие слово '{keyword}':",
+                f"Вакансий по ключевому слову '{keyword}' не найдено."
+            )
 
         elif choice == '5':
             companies_vacancies: List[Tuple[str, int]] = db_manager.get_companies_and_vacancies_count()
@@ -181,23 +193,196 @@ def user_interaction(db_manager: DBManager) -> None:
             print("Некорректный ввод. выберите число от 1 до 6.")
 
 
-def main() -> None:
+def is_data_fresh(db_manager: DBManager) -> bool:
     """
-    Основная функция запуска программы
+    Проверяет, что все компании синхронизированы не раньше чем SYNC_FRESHNESS_MINUTES минут назад
     """
-    create_database_if_not_exists()
+    last_sync: Optional[datetime] = db_manager.get_last_sync_time(COMPANY_IDS)
+    if last_sync is None or SYNC_FRESHNESS_MINUTES <= 0:
+        return False
+    if datetime.now(timezone.utc) - last_sync >= timedelta(minutes=SYNC_FRESHNESS_MINUTES):
+        return False
+    print(f"Данные актуальны (синхронизация {last_sync:%Y-%m-%d %H:%M}), загрузка пропущена.")
+    return True
+
+
+def sync_data(
+        db_manager: DBManager,
+        full: bool = False,
+        client: Optional[APIClient] = None,
+        company_ids: Optional[List[int]] = None,
+        db_params: Optional[Dict] = None
+) -> None:
+    """
+    Синхронизирует курсы валют, компании и вакансии с API и при необходимости загружает детали вакансий.
+    client и company_ids по умолчанию - клиент create_api_client() и COMPANY_IDS из окружения,
+    db_params - параметры той же базы, что и db_manager, для процессов загрузки (по умолчанию get_db_params())
+    """
+    if client is None:
+        own_client = create_api_client()
+        try:
+            sync_data(db_manager, full, own_client, company_ids, db_params)
+        finally:
+            own_client.close()
+        return
+    company_ids = company_ids or COMPANY_IDS
+    update_exchange_rates(client, db_manager)
+    batch_size = int(os.getenv('DB_BATCH_SIZE', 1000))
+    job_runner = IngestJobRunner(
+        client,
+        db_manager,
+        db_params=db_params or get_db_params(),
+        processes=int(os.getenv('INGEST_PROCESSES', 1)),
+        batch_size=batch_size
+    )
+    print(f"Синхронизируем {len(company_ids)} компаний и их вакансии (потоков: {client.max_workers})...")
+    SyncEngine(client, db_manager, batch_size=batch_size, job_runner=job_runner).sync(company_ids, full)
+    HistoryManager(db_manager, HISTORY_RETENTION_MONTHS).record_after_sync()
+    if os.getenv('ENRICH_VACANCIES', '0') == '1':
+        print("Загружаем детали новых и измененных вакансий...")
+        VacancyEnricher(client, db_manager, max_workers=client.max_workers).run()
+    if client.cache is not None:
+        print(f"Кэш API: {client.cache.stats}")
+    stats: Dict[str, int] = client.stats
+    print(f"Запросов к API: {stats['requests']}, повторов: {stats['retries']}, отказов: {stats['give_ups']}")
+
+
+def run_read_command(reader: VacancyReader, args: argparse.Namespace) -> None:
+    """
+    Выполняет читающую команду avg-salary, search или companies по базе или ее снимку и выводит результат
+    """
+    if args.command == 'avg-salary':
+        avg_salary: Optional[float] = reader.get_avg_salary()
+        print(f"{avg_salary:.2f}" if avg_salary is not None else "Нет данных для расчета средней зарплаты.")
 
-    db_params: Dict[str, Optional[str]] = {
-        'db_name': 'vacancy',
-        'user': os.getenv('DB_USER'),
-        'password': os.getenv('DB_PASSWORD'),
-        'host': os.getenv('DB_HOST'),
-        'port': int(os.getenv('DB_PORT', 5432))
-    }
+    elif args.command == 'search':
+        vacancies = reader.get_vacancies_with_keyword(args.keyword, limit=args.limit)
+        if not vacancies:
+            print(f"Вакансий по ключевому слову '{args.keyword}' не найдено.")
+        for company_name, vacancy_name, salary_range, url in vacancies:
+            print(f"{company_name}\t{vacancy_name}\t{salary_range}\t{url}")
+
+    elif args.command == 'companies':
+        for company, count in reader.get_companies_and_vacancies_count():
+            print(f"{company}\t{count}")
 
-    db_manager = DBManager(**db_params)
-    initialize_database(db_manager)
-    user_interaction(db_manager)
+
+def run_query_command(db_manager: DBManager, args: argparse.Namespace) -> None:
+    """
+    Выполняет один запрос к базе для неинтерактивной команды и выводит результат
+    """
+    if args.command in READ_COMMANDS:
+        run_read_command(db_manager, args)
+
+    elif args.command == 'export':
+        filter_name = 'keyword' if args.keyword else 'higher-salary' if args.higher_salary else 'all'
+        rows = VacancyExporter(db_manager).export(
+            args.path, filter_name, args.keyword, fmt=args.format, compress=args.gzip or None
+        )
+        print(f"Выгружено вакансий: {rows} в {args.path}")
+
+    elif args.command == 'salary-stats':
+        analytics = SalaryAnalytics(db_manager)
+        header = '\t'.join(['группа', 'вакансий', 'средняя'] + [f'p{round(p * 100)}' for p in PERCENTILES])
+        for dimension, groups in analytics.distribution(args.by, min_count=args.min_count).items():
+            print(f"\n[{dimension}]\n{header}")
+            for group in groups:
+                values = [f"{group['avg']:.0f}"] + [f"{value:.0f}" for value in group['percentiles'].values()]
+                print('\t'.join([str(group['key'] or '-'), str(group['count'])] + values))
+        if args.histogram:
+            for key, bins in analytics.histogram(args.histogram, dimension=args.histogram_by).items():
+                print(f"\n[гистограмма: {key or '-'}]")
+                for low, high, count in bins:
+                    print(f"{low:.0f}-{high:.0f}\t{count}")
+
+    elif args.command == 'trends':
+        since = datetime.now(timezone.utc) - timedelta(days=31 * args.months)
+        trends = HistoryManager(db_manager).get_trends(args.company, since=since, bucket=args.bucket)
+        if not trends:
+            print("Нет данных истории за выбранный период.")
+        for period, company_name, open_count, avg_salary, median_salary in trends:
+            salaries = [f"{value:.0f}" if value is not None else '-' for value in (avg_salary, median_salary)]
+            print('\t'.join([f"{period:%Y-%m-%d}", company_name, f"{open_count:.0f}"] + salaries))
+
+    elif args.command == 'snapshot':
+        rows = create_snapshot(db_manager, args.path)
+        print(f"Снимок сохранен: {rows} вакансий в {args.path}")
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    """
+    Разбирает аргументы командной строки. Без команды запускается интерактивное меню
+    """
+    parser = argparse.ArgumentParser(description='Вакансии работодателей с hh.ru')
+    parser.add_argument('--snapshot', help='выполнять avg-salary, search и companies по снимку без Postgres')
+    subparsers = parser.add_subparsers(dest='command')
+    ingest = subparsers.add_parser('ingest', help='синхронизировать данные с API и выйти')
+    ingest.add_argument('--full', action='store_true', help='полный обход вместо загрузки изменений')
+    subparsers.add_parser('avg-salary', help='средняя зарплата по вакансиям')
+    search = subparsers.add_parser('search', help='поиск вакансий по ключевому слову')
+    search.add_argument('keyword')
+    search.add_argument('--limit', type=int, default=None, help='сколько вакансий вывести')
+    subparsers.add_parser('companies', help='компании и количество их вакансий')
+    export = subparsers.add_parser('export', help='выгрузить вакансии в CSV, JSONL или Parquet')
+    export.add_argument('path', help='файл выгрузки, формат по расширению: .csv, .jsonl, .parquet, .csv.gz')
+    export.add_argument('--format', choices=FORMATS, help='формат, если не подходит расширение')
+    export.add_argument('--gzip', action='store_true', help='сжать CSV/JSONL gzip')
+    export_filter = export.add_mutually_exclusive_group()
+    export_filter.add_argument('--higher-salary', action='store_true', help='только с зарплатой выше средней')
+    export_filter.add_argument('--keyword', help='только вакансии по ключевому слову')
+    salary_stats = subparsers.add_parser('salary-stats', help='распределение зарплат в рублях')
+    salary_stats.add_argument('--by', nargs='*', choices=list(DIMENSIONS), default=list(DIMENSIONS),
+                              help='разрезы распределения')
+    salary_stats.add_argument('--min-count', type=int, default=5, help='минимум вакансий в группе')
+    salary_stats.add_argument('--histogram', type=int, default=0, help='число корзин гистограммы')
+    salary_stats.add_argument('--histogram-by', choices=list(DIMENSIONS),
+                              help='строить гистограмму отдельно по каждой группе разреза')
+    trends = subparsers.add_parser('trends', help='число вакансий и зарплаты компаний по периодам')
+    trends.add_argument('--company', type=int, help='id компании')
+    trends.add_argument('--months', type=int, default=12, help='за сколько последних месяцев')
+    trends.add_argument('--bucket', choices=TREND_BUCKETS, default='month', help='период группировки')
+    snapshot = subparsers.add_parser('snapshot', help='сохранить колоночный снимок базы для запросов без Postgres')
+    snapshot.add_argument('path', help='каталог снимка')
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    """
+    Основная функция запуска программы. Команды avg-salary, search, companies, salary-stats, trends, export
+    и snapshot выполняют один запрос к уже заполненной базе, без проверки базы и обращений к API
+    """
+    args = parse_args(argv)
+
+    if args.snapshot and args.command in READ_COMMANDS:
+        try:
+            run_read_command(SnapshotDB(args.snapshot), args)
+        except (OSError, ValueError, RuntimeError) as e:
+            print(f"Ошибка чтения снимка: {e}")
+            sys.exit(1)
+        return
+
+    if args.command in ('avg-salary', 'search', 'companies', 'salary-stats', 'trends', 'export', 'snapshot'):
+        db_manager = DBManager(**get_db_params(), max_connections=1, metrics=metrics)
+        try:
+            run_query_command(db_manager, args)
+        except psycopg2.Error as e:
+            print(f"Ошибка запроса к БД: {e}")
+            sys.exit(1)
+        except (ValueError, RuntimeError) as e:
+            print(f"Ошибка: {e}")
+            sys.exit(1)
+        finally:
+            db_manager.close()
+        return
+
+    create_database_if_not_exists()
+    db_manager = DBManager(**get_db_params(), max_connections=int(os.getenv('DB_POOL_SIZE', 10)), metrics=metrics)
+    print("Создаем таблицы...")
+    db_manager.create_tables()
+    if args.command == 'ingest' or not is_data_fresh(db_manager):
+        sync_data(db_manager, full=args.command == 'ingest' and args.full)
+    if args.command is None:
+        user_interaction(db_manager)
     db_manager.close()
 
 
@@ -1,7 +1,36 @@
+import random
+import re
+import threading
 import time
-from typing import Dict, List, Optional
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from email.utils import parsedate_to_datetime
+from itertools import islice
+from typing import Callable, Dict, Iterator, List, Optional, Tuple, TypeVar, cast
+from urllib.parse import urlparse
 
 import requests
+from requests.adapters import HTTPAdapter
+
+from modules.cache_module import ResponseCache
+from modules.metrics_module import Metrics
+from modules.rate_limiter import TokenBucket
+
+T = TypeVar('T')
+R = TypeVar('R')
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+MAX_PER_PAGE = 100
+DEEP_PAGINATION_LIMIT = 2000
+# hh снимает вакансию с публикации через 30 дней, если ее не продлили (продление обновляет published_at)
+VACANCY_MAX_AGE = timedelta(days=30)
+ID_IN_PATH_RE = re.compile(r'/\d+')
+
+
+class APIError(Exception):
+    """
+    Ошибка получения данных от API hh
+    """
 
 
 class APIClient:
@@ -9,60 +38,285 @@ class APIClient:
     Взаимодействие с API hh
     """
 
-    def __init__(self, base_url: str = "https://api.hh.ru") -> None:
+    def __init__(
+            self,
+            base_url: str = "https://api.hh.ru",
+            max_workers: int = 1,
+            rate_limit: float = 5.0,
+            burst: int = 5,
+            pool_size: int = 10,
+            timeout: Tuple[float, float] = (5.0, 30.0),
+            max_retries: int = 5,
+            backoff_base: float = 0.5,
+            backoff_max: float = 30.0,
+            retry_after_max: float = 600.0,
+            cache: Optional[ResponseCache] = None,
+            metrics: Optional[Metrics] = None
+    ) -> None:
         """
-        Инициализация API
+        Инициализация API.
+        max_workers - число потоков для параллельной загрузки,
+        rate_limit и burst - общий для всех потоков лимит запросов в секунду и допустимый всплеск,
+        pool_size и timeout - размер пула keep-alive соединений и таймауты (connect, read),
+        max_retries, backoff_base и backoff_max - параметры повторов при 429/5xx,
+        retry_after_max - самая долгая пауза по Retry-After, при большей запрос не повторяется,
+        cache - локальный кэш ответов для профилей компаний и деталей вакансий,
+        metrics - сборщик метрик запросов (задержки, коды ответов, объем, ожидание лимита)
         """
         self.base_url: str = base_url
+        self.max_workers: int = max(1, max_workers)
+        self.rate_limiter: TokenBucket = TokenBucket(rate=rate_limit, capacity=burst)
+        self.timeout: Tuple[float, float] = timeout
+        self.max_retries: int = max_retries
+        self.backoff_base: float = backoff_base
+        self.backoff_max: float = backoff_max
+        self.retry_after_max: float = retry_after_max
+        self.cache: Optional[ResponseCache] = cache
+        self.metrics: Optional[Metrics] = metrics
+
+        pool_maxsize = max(pool_size, self.max_workers)
+        self.session: requests.Session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_maxsize, pool_maxsize=pool_maxsize, max_retries=0)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+        self.stats: Dict[str, int] = {'requests': 0, 'retries': 0, 'give_ups': 0}
+        self._stats_lock = threading.Lock()
+
+    def _count(self, key: str) -> None:
+        """
+        Увеличивает счетчик статистики запросов
+        """
+        with self._stats_lock:
+            self.stats[key] += 1
+
+    @staticmethod
+    def _retry_after(response: Optional[requests.Response]) -> Optional[float]:
+        """
+        Пауза из заголовка Retry-After ответа в секундах (число секунд или дата) или None, если его нет
+        """
+        retry_after = response.headers.get('Retry-After') if response is not None else None
+        if not retry_after:
+            return None
+        try:
+            return max(0.0, float(retry_after))
+        except ValueError:
+            try:
+                return max(0.0, parsedate_to_datetime(retry_after).timestamp() - time.time())
+            except (TypeError, ValueError):
+                return None
+
+    def _retry_delay(self, attempt: int, response: Optional[requests.Response]) -> float:
+        """
+        Вычисляет паузу перед повтором: Retry-After из ответа целиком или экспоненциальная задержка с джиттером
+        """
+        retry_after = self._retry_after(response)
+        if retry_after is not None:
+            return retry_after
+        delay = min(self.backoff_max, self.backoff_base * 2 ** attempt)
+        return random.uniform(delay / 2, delay)
+
+    def _get(
+            self,
+            url: str,
+            params: Optional[Dict] = None,
+            headers: Optional[Dict[str, str]] = None
+    ) -> Optional[requests.Response]:
+        """
+        Выполняет GET запрос через общий пул соединений с повторами при 429/5xx и сетевых ошибках.
+        Возвращает последний полученный ответ или None, если сервер так и не ответил
+        """
+        response: Optional[requests.Response] = None
+        endpoint = ID_IN_PATH_RE.sub('/{id}', urlparse(url).path)
+        for attempt in range(self.max_retries + 1):
+            waited = self.rate_limiter.acquire()
+            self._count('requests')
+            started = time.perf_counter()
+            try:
+                response = self.session.get(url, params=params, headers=headers, timeout=self.timeout)
+            except requests.RequestException as e:
+                print(f"Сетевая ошибка при запросе {url}: {e}")
+                response = None
+            if self.metrics is not None:
+                self.metrics.observe_rate_limit_wait(waited)
+                self.metrics.observe_http(
+                    endpoint,
+                    time.perf_counter() - started,
+                    response.status_code if response is not None else 'error',
+                    len(response.content) if response is not None else 0
+                )
+            if response is not None and response.status_code not in RETRY_STATUSES:
+                return response
+
+            if attempt == self.max_retries:
+                break
+            delay = self._retry_delay(attempt, response)
+            if delay > self.retry_after_max:
+                print(f"Сервер просит повторить запрос {url} через {delay:.0f} с, это дольше "
+                      f"{self.retry_after_max:.0f} с - запрос не повторяется")
+                break
+            self._count('retries')
+            if response is not None and response.status_code == 429:
+                # лимит общий для всех потоков - остальные тоже ждут, а не получают такой же 429
+                self.rate_limiter.pause(delay)
+            time.sleep(delay)
+
+        self._count('give_ups')
+        return response
+
+    def _get_json(
+            self,
+            url: str,
+            error_message: str,
+            params: Optional[Dict] = None,
+            revalidate: bool = False
+    ) -> Optional[Dict]:
+        """
+        Получает JSON ресурса через локальный кэш: свежая запись отдается без запроса,
+        устаревшая ревалидируется по ETag. revalidate=True проверяет по ETag и свежую запись -
+        для данных, от которых зависят решения синхронизации
+        """
+        key = ResponseCache.make_key(url, params)
+        entry = self.cache.get(key) if self.cache is not None else None
+        if entry is not None and entry.fresh and not revalidate:
+            return entry.data
+
+        headers = {'If-None-Match': entry.etag} if entry is not None and entry.etag else None
+        response = self._get(url, params=params, headers=headers)
+        if response is not None and response.status_code == 304 and entry is not None and self.cache is not None:
+            self.cache.revalidate(key)
+            return entry.data
+        if response is not None and response.status_code == 200:
+            if self.cache is not None:
+                self.cache.put(key, response.content, response.headers.get('ETag'))
+            return cast(Dict, response.json())
+
+        status = response.status_code if response is not None else 'нет ответа'
+        print(f"{error_message}: {status}")
+        return None
+
+    def close(self) -> None:
+        """
+        Закрывает пул HTTP соединений и кэш
+        """
+        self.session.close()
+        if self.cache is not None:
+            self.cache.close()
 
-    def get_companies(self, ids: List[int]) -> List[Dict]:
+    def _map(self, func: Callable[[T], R], items: List[T]) -> List[R]:
+        """
+        Применяет функцию к элементам последовательно или в пуле потоков, сохраняя порядок
+        """
+        if self.max_workers == 1 or len(items) <= 1:
+            return [func(item) for item in items]
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(items))) as executor:
+            return list(executor.map(func, items))
+
+    def get_company(self, company_id: int, revalidate: bool = False) -> Optional[Dict]:
+        """
+        Получает информацию о компании по её id. revalidate=True сверяет кэшированный профиль
+        с сервером по ETag, чтобы не использовать устаревший open_vacancies
+        """
+        return self._get_json(
+            f"{self.base_url}/employers/{company_id}",
+            f"Ошибка получения данных о компании {company_id}",
+            revalidate=revalidate
+        )
+
+    def get_companies(self, ids: List[int], revalidate: bool = False) -> List[Dict]:
         """
         Получает информацию о компаниях по списку их id
         """
-        companies: List[Dict] = []
-        for company_id in ids:
-            response = requests.get(f"{self.base_url}/employers/{company_id}")
-            if response.status_code == 200:
-                companies.append(response.json())
-            else:
-                print(f"Ошибка получения данных о компании {company_id}: {response.status_code}")
-            time.sleep(0.2)
-        return companies
+        companies = self._map(lambda company_id: self.get_company(company_id, revalidate), ids)
+        return [company for company in companies if company is not None]
 
-    def get_vacancies_for_company(
+    def iter_vacancy_pages(
             self,
             company_id: int,
-            per_page: int = 50,
-            pages: int = 1
-    ) -> List[Dict]:
+            per_page: int = 100,
+            start_page: int = 0,
+            params: Optional[Dict] = None,
+            strict: bool = False
+    ) -> Iterator[List[Dict]]:
         """
-        Получает вакансии для компании по её id
+        Постранично обходит все вакансии компании, отдавая каждую страницу сразу после загрузки.
+        Учитывает поля pages/found ответа и ограничение API на глубину выдачи (DEEP_PAGINATION_LIMIT).
+        В режиме strict ошибка загрузки страницы поднимает APIError вместо тихого завершения обхода
         """
-        vacancies: List[Dict] = []
-        for page in range(pages):
-            params: Dict[str, int] = {
+        per_page = max(1, min(per_page, MAX_PER_PAGE))
+        max_pages = DEEP_PAGINATION_LIMIT // per_page
+        page = start_page
+        while page < max_pages:
+            query: Dict = {
                 'employer_id': company_id,
                 'per_page': per_page,
                 'page': page
             }
-            response = requests.get(f"{self.base_url}/vacancies", params=params)
-            if response.status_code == 200:
+            if params:
+                query.update(params)
+            response = self._get(f"{self.base_url}/vacancies", params=query)
+            if response is None or response.status_code != 200:
+                status = response.status_code if response is not None else 'нет ответа'
+                message = f"Ошибка получения вакансий для компании {company_id} (страница {page}): {status}"
+                if strict:
+                    raise APIError(message)
+                print(message)
+                return
+
+            try:
                 data = response.json()
-                vacancies.extend(data.get('items', []))
-                if data.get('pages', 0) <= page + 1:
-                    break
-            else:
-                print(f"Ошибка получения вакансий для компании {company_id}: {response.status_code}")
-            time.sleep(0.2)
-        return vacancies
-
-    def get_vacancy_details(self, vacancy_id: int) -> Optional[Dict]:
-        """
-        Получает полную информацию о вакансии по её id
-        """
-        response = requests.get(f"{self.base_url}/vacancies/{vacancy_id}")
-        if response.status_code == 200:
-            return response.json()
-        else:
-            print(f"Ошибка получения данных о вакансии {vacancy_id}: {response.status_code}")
+            except ValueError as e:
+                message = f"Некорректный ответ с вакансиями компании {company_id} (страница {page}): {e}"
+                if strict:
+                    raise APIError(message) from e
+                print(message)
+                return
+            items: List[Dict] = data.get('items', [])
+            if items:
+                yield items
+
+            total_pages = min(data.get('pages', 0), max_pages)
+            found: int = data.get('found', 0)
+            if not items or page + 1 >= total_pages or (page + 1) * per_page >= found:
+                if found > DEEP_PAGINATION_LIMIT:
+                    print(
+                        f"У компании {company_id} найдено {found} вакансий, API отдает только первые "
+                        f"{DEEP_PAGINATION_LIMIT}"
+                    )
+                return
+            page += 1
+
+    def get_vacancies_for_company(
+            self,
+            company_id: int,
+            per_page: int = 100,
+            pages: Optional[int] = None
+    ) -> List[Dict]:
+        """
+        Получает вакансии для компании по её id (все страницы, если pages не задан)
+        """
+        # islice останавливает генератор до запроса лишней страницы
+        page_items = islice(self.iter_vacancy_pages(company_id, per_page=per_page), pages)
+        return [vacancy for items in page_items for vacancy in items]
+
+    def get_vacancy_details(self, vacancy_id: int, revalidate: bool = False) -> Optional[Dict]:
+        """
+        Получает полную информацию о вакансии по её id. revalidate=True сверяет кэшированный ответ
+        с сервером по ETag, даже если он еще свежий
+        """
+        return self._get_json(
+            f"{self.base_url}/vacancies/{vacancy_id}",
+            f"Ошибка получения данных о вакансии {vacancy_id}",
+            revalidate=revalidate
+        )
+
+    def get_currency_rates(self) -> Optional[Dict[str, float]]:
+        """
+        Получает курсы валют из справочников hh: код валюты -> сколько единиц валюты в одном рубле
+        """
+        dictionaries = self._get_json(f"{self.base_url}/dictionaries", "Ошибка получения справочников")
+        if dictionaries is None:
             return None
+        return {
+            currency['code']: currency['rate'] for currency in dictionaries.get('currency', []) if currency.get('rate')
+        }
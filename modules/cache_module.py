@@ -0,0 +1,138 @@
+import json
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from typing import Dict, Optional
+from urllib.parse import urlencode, urlparse
+
+DEFAULT_TTLS: Dict[str, int] = {
+    '/employers/': 24 * 3600,
+    '/vacancies/': 6 * 3600,
+}
+
+
+@dataclass
+class CacheEntry:
+    """
+    Запись кэша: тело ответа, ETag и признак свежести
+    """
+    data: Dict
+    etag: Optional[str]
+    fresh: bool
+
+
+class ResponseCache:
+    """
+    Локальный кэш HTTP ответов в SQLite с TTL по эндпоинтам и LRU вытеснением по размеру
+    """
+
+    def __init__(
+            self,
+            path: str = '.hh_cache.sqlite',
+            max_bytes: int = 100 * 1024 * 1024,
+            ttls: Optional[Dict[str, int]] = None,
+            default_ttl: int = 3600
+    ) -> None:
+        """
+        path - файл кэша, max_bytes - предельный размер тел ответов,
+        ttls - время жизни записей в секундах по префиксу пути, default_ttl - для остальных путей
+        """
+        self.max_bytes: int = max_bytes
+        self.ttls: Dict[str, int] = ttls if ttls is not None else DEFAULT_TTLS
+        self.default_ttl: int = default_ttl
+        self.stats: Dict[str, int] = {'hits': 0, 'misses': 0, 'revalidated': 0, 'evictions': 0}
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, timeout=30, isolation_level=None)
+        self._db.execute('PRAGMA journal_mode=WAL;')
+        self._db.execute('''
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                body BLOB NOT NULL,
+                etag TEXT,
+                expires_at REAL NOT NULL,
+                accessed_at REAL NOT NULL,
+                size INTEGER NOT NULL
+            );
+        ''')
+        self._db.execute('CREATE INDEX IF NOT EXISTS responses_accessed_at_idx ON responses (accessed_at);')
+        self._size: int = self._db.execute('SELECT COALESCE(SUM(size), 0) FROM responses;').fetchone()[0]
+
+    @staticmethod
+    def make_key(url: str, params: Optional[Dict] = None) -> str:
+        """
+        Строит ключ кэша из адреса и отсортированных параметров запроса
+        """
+        return f"{url}?{urlencode(sorted(params.items()))}" if params else url
+
+    def ttl_for(self, key: str) -> int:
+        """
+        Возвращает TTL для адреса по самому длинному подходящему префиксу пути
+        """
+        path = urlparse(key).path
+        matches = [prefix for prefix in self.ttls if path.startswith(prefix)]
+        return self.ttls[max(matches, key=len)] if matches else self.default_ttl
+
+    def get(self, key: str) -> Optional[CacheEntry]:
+        """
+        Возвращает запись кэша (в том числе устаревшую - для ревалидации по ETag) или None
+        """
+        now = time.time()
+        with self._lock:
+            row = self._db.execute('SELECT body, etag, expires_at FROM responses WHERE key = ?;', (key,)).fetchone()
+            if row is None:
+                self.stats['misses'] += 1
+                return None
+            self._db.execute('UPDATE responses SET accessed_at = ? WHERE key = ?;', (now, key))
+            fresh = row[2] > now
+            self.stats['hits' if fresh else 'misses'] += 1
+        return CacheEntry(data=json.loads(row[0]), etag=row[1], fresh=fresh)
+
+    def put(self, key: str, body: bytes, etag: Optional[str]) -> None:
+        """
+        Сохраняет ответ и при превышении размера вытесняет давно не использованные записи
+        """
+        now = time.time()
+        with self._lock:
+            old = self._db.execute('SELECT size FROM responses WHERE key = ?;', (key,)).fetchone()
+            self._db.execute(
+                'INSERT OR REPLACE INTO responses (key, body, etag, expires_at, accessed_at, size) '
+                'VALUES (?, ?, ?, ?, ?, ?);',
+                (key, body, etag, now + self.ttl_for(key), now, len(body))
+            )
+            self._size += len(body) - (old[0] if old else 0)
+            if self._size > self.max_bytes:
+                self._evict()
+
+    def revalidate(self, key: str) -> None:
+        """
+        Продлевает срок жизни записи после ответа 304 Not Modified
+        """
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                'UPDATE responses SET expires_at = ?, accessed_at = ? WHERE key = ?;',
+                (now + self.ttl_for(key), now, key)
+            )
+            self.stats['revalidated'] += 1
+
+    def _evict(self) -> None:
+        """
+        Удаляет записи в порядке давности использования, пока кэш не уложится в max_bytes
+        """
+        rows = self._db.execute('SELECT key, size FROM responses ORDER BY accessed_at;').fetchall()
+        to_delete = []
+        for key, size in rows:
+            if self._size <= self.max_bytes:
+                break
+            to_delete.append((key,))
+            self._size -= size
+        self._db.executemany('DELETE FROM responses WHERE key = ?;', to_delete)
+        self.stats['evictions'] += len(to_delete)
+
+    def close(self) -> None:
+        """
+        Закрывает файл кэша
+        """
+        with self._lock:
+            self._db.close()
@@ -1,7 +1,147 @@
-from typing import List, Optional, Tuple
+import csv
+import hashlib
+import io
+import json
+import re
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import date, datetime
+from itertools import islice
+from typing import (Any, BinaryIO, Callable, Dict, Iterable, Iterator, List, Optional, Protocol, Sequence, Set,
+                    Tuple, Union, cast)
 
 import psycopg2
-from psycopg2.extensions import connection, cursor
+from psycopg2.extensions import TRANSACTION_STATUS_IDLE, connection, cursor, encodings
+from psycopg2.extras import execute_values
+from psycopg2.pool import ThreadedConnectionPool
+
+from modules.metrics_module import Metrics, instrumented
+from modules.migrations import MIGRATIONS
+
+VACANCY_COLUMNS = (
+    'vacancy_id', 'company_id', 'name', 'salary_from', 'salary_to', 'salary_currency', 'url',
+    'published_at', 'content_hash'
+)
+VACANCY_UPDATES = ', '.join(f'{column} = EXCLUDED.{column}' for column in VACANCY_COLUMNS[1:])
+
+AVG_SALARY_QUERY = 'SELECT SUM(salary_sum) / NULLIF(SUM(salary_count), 0) FROM company_stats'
+
+HIGHER_SALARY_CTE = f'WITH avg_salary AS ({AVG_SALARY_QUERY})'
+HIGHER_SALARY_FILTER = 'v.salary_rub > (SELECT * FROM avg_salary)'
+
+KEYWORD_QUERY_CTE = '''
+WITH q AS (
+    SELECT websearch_to_tsquery('russian', %(keyword)s) || websearch_to_tsquery('english', %(keyword)s) AS tsq
+)
+'''
+KEYWORD_FILTER = 'v.search_vector @@ (SELECT tsq FROM q) OR v.name ILIKE %(pattern)s'
+KEYWORD_RANK = '(ts_rank_cd(v.search_vector, (SELECT tsq FROM q)) + similarity(v.name, %(keyword)s))::float8'
+KEYWORD_RANK_ORDER = f'{KEYWORD_RANK} DESC, v.vacancy_id'
+# Следующая страница выдачи по релевантности: строки после (ранг, id) последней показанной вакансии
+KEYWORD_AFTER_FILTER = (
+    f'(%(after_rank)s::float8 IS NULL '
+    f'OR ({KEYWORD_RANK}, -v.vacancy_id) < (%(after_rank)s::float8, -%(after_id)s::bigint))'
+)
+
+# Разрезы распределения зарплат: имя -> выражение группировки
+SALARY_DIMENSIONS: Dict[str, str] = {
+    'company': 'c.name',
+    'city': 'v.city',
+    'experience': 'v.experience',
+}
+
+EXPORT_FILTERS = ('all', 'higher-salary', 'keyword')
+EXPORT_QUERY = '''
+{with_clause}
+SELECT v.vacancy_id, v.company_id, c.name AS company_name, v.name, v.salary_from{numeric}, v.salary_to{numeric},
+       v.salary_currency, v.city, v.experience, v.employment, v.schedule, v.url, v.published_at
+FROM vacancies v
+JOIN companies c ON v.company_id = c.company_id
+WHERE {where}
+ORDER BY {order_by}
+'''
+
+# В CSV режиме COPY экранирует только символ кавычки и разделитель. Берем управляющие символы,
+# которых не бывает в выводе row_to_json (в JSON они всегда экранированы как \uXXXX) -
+# тогда каждая строка выходит готовым JSON объектом без дополнительного экранирования
+JSONL_COPY_OPTIONS = "FORMAT csv, QUOTE E'\\x01', DELIMITER E'\\x02'"
+COPY_FORMATS = ('csv', 'jsonl')
+
+# Запросы, план которых можно снять EXPLAIN ANALYZE
+EXPLAINABLE_STATEMENTS = ('SELECT', 'WITH', 'INSERT', 'UPDATE', 'DELETE')
+REFRESH_RE = re.compile(r'^\s*REFRESH\s+MATERIALIZED\s+VIEW\s+(?:CONCURRENTLY\s+)?(\w+)', re.IGNORECASE)
+
+
+def format_salary(salary_from: Optional[float], salary_to: Optional[float]) -> str:
+    """
+    Форматирует вилку зарплаты для вывода
+    """
+    try:
+        sf = float(salary_from) if salary_from is not None else None
+        st = float(salary_to) if salary_to is not None else None
+    except (TypeError, ValueError):
+        sf = None
+        st = None
+
+    if sf is not None and st is not None:
+        return f"от {sf} до {st}"
+    elif sf is not None:
+        return f"от {sf}"
+    elif st is not None:
+        return f"до {st}"
+    return "Зарплата не указана"
+
+
+class TimedCursor(cursor):
+    """
+    Курсор, который замеряет каждый execute и передает время обработчику on_executed.
+    У именованного (серверного) курсора execute только открывает его, время чтения замеряет читающий код
+    """
+    on_executed: Optional[Callable[[Any, Any, Any, float], None]] = None
+
+    def execute(self, query: Any, vars: Any = None) -> None:
+        started = time.perf_counter()
+        super().execute(query, vars)
+        if self.on_executed is not None and self.name is None:
+            self.on_executed(self, query, vars, time.perf_counter() - started)
+
+
+class VacancyReader(Protocol):
+    """
+    Читающие запросы, общие для DBManager и снимка базы SnapshotDB
+    """
+
+    def get_companies_and_vacancies_count(self) -> List[Tuple[str, int]]:
+        """
+        Список кортежей с названием компании и количеством вакансий
+        """
+
+    def get_all_vacancies(self) -> List[Tuple[str, str, str, str]]:
+        """
+        Все вакансии: компания, вакансия, зарплата, ссылка
+        """
+
+    def get_avg_salary(self) -> Optional[float]:
+        """
+        Средняя зарплата в рублях
+        """
+
+    def get_vacancies_with_higher_salary(self) -> List[Tuple[str, str, str, str]]:
+        """
+        Вакансии с зарплатой в рублях выше средней
+        """
+
+    def get_vacancies_with_keyword(
+            self,
+            keyword: str,
+            limit: Optional[int] = None,
+            offset: int = 0
+    ) -> List[Tuple[str, str, str, str]]:
+        """
+        Вакансии по ключевому слову, limit/offset задают страницу выдачи
+        """
 
 
 class DBManager:
@@ -11,53 +151,225 @@ class DBManager:
             user: str,
             password: str,
             host: str = 'localhost',
-            port: int = 5432
+            port: int = 5432,
+            min_connections: Optional[int] = None,
+            max_connections: int = 10,
+            health_check_interval: float = 30.0,
+            metrics: Optional[Metrics] = None
     ) -> None:
         """
-        Инициализация соединения с базой данных PostgreSQL
+        Инициализация пула соединений с базой данных PostgreSQL.
+        min_connections/max_connections - границы пула, health_check_interval - через сколько секунд
+        простоя соединение проверяется запросом перед выдачей, metrics - сборщик метрик запросов.
+        Пул закрывает возвращенные соединения сверх min_connections, поэтому по умолчанию
+        min_connections = max_connections - иначе каждая параллельная выдача открывала бы новое соединение
         """
-        self.connection: connection = psycopg2.connect(
+        self.pool: ThreadedConnectionPool = ThreadedConnectionPool(
+            max_connections if min_connections is None else min_connections,
+            max_connections,
             dbname=db_name,
             user=user,
             password=password,
             host=host,
             port=port
         )
-        self.connection.autocommit = True
-        self.cursor: cursor = self.connection.cursor()
+        self.health_check_interval: float = health_check_interval
+        self.metrics: Optional[Metrics] = metrics
+        # ThreadedConnectionPool не ждет свободного соединения, а сразу падает - ограничиваем выдачу семафором
+        self._slots = threading.BoundedSemaphore(max_connections)
+        self._last_used: Dict[int, float] = {}
 
-    def create_tables(self) -> None:
+    def _is_alive(self, conn: connection) -> bool:
         """
-        Создает таблицы компаний и вакансий
+        Проверяет соединение: закрытое отбрасывается сразу, долго простаивавшее - проверяется запросом.
+        У только что открытого соединения еще нет отметки простоя, его проверять незачем
         """
-        create_companies_table = '''
-        CREATE TABLE IF NOT EXISTS companies (
-            id SERIAL PRIMARY KEY,
-            company_id INTEGER UNIQUE NOT NULL,
-            name TEXT NOT NULL,
-            url TEXT
-        );
-        '''
+        if conn.closed:
+            return False
+        last_used = self._last_used.get(id(conn))
+        if last_used is None or time.monotonic() - last_used < self.health_check_interval:
+            return True
+        try:
+            conn.autocommit = True
+            with conn.cursor() as cur:
+                cur.execute('SELECT 1;')
+            return True
+        except psycopg2.Error:
+            return False
 
-        create_vacancies_table = '''
-        CREATE TABLE IF NOT EXISTS vacancies (
-            vacancy_id SERIAL PRIMARY KEY,
-            name TEXT NOT NULL,
-            description TEXT,
-            company_id INTEGER REFERENCES companies(company_id),
-            url TEXT,
-            salary_from TEXT,
-            salary_to TEXT,
-            salary_currency TEXT,
-            city TEXT,
-            experience TEXT,
-            employment TEXT,
-            schedule TEXT
-        );
-        '''
-        self.cursor.execute(create_companies_table)
-        self.cursor.execute(create_vacancies_table)
+    @contextmanager
+    def _connection(self) -> Iterator[connection]:
+        """
+        Выдает соединение из пула на время блока. Разорванные соединения закрываются и заменяются новыми
+        """
+        self._slots.acquire()
+        conn: Optional[connection] = None
+        try:
+            conn = self.pool.getconn()
+            while not self._is_alive(conn):
+                self._discard(conn)
+                # если getconn упадет, finally не должен возвращать в пул уже закрытое соединение
+                conn = None
+                conn = self.pool.getconn()
+            try:
+                yield conn
+            except (psycopg2.OperationalError, psycopg2.InterfaceError):
+                self._discard(conn)
+                conn = None
+                raise
+        finally:
+            if conn is not None:
+                if not conn.closed and conn.info.transaction_status != TRANSACTION_STATUS_IDLE:
+                    conn.rollback()
+                self._last_used[id(conn)] = time.monotonic()
+                self.pool.putconn(conn, close=bool(conn.closed))
+                if conn.closed:
+                    # пул закрывает и соединения сверх min_connections - их отметки тоже убираем
+                    self._last_used.pop(id(conn), None)
+            self._slots.release()
+
+    def _discard(self, conn: connection) -> None:
+        """
+        Закрывает соединение и убирает его из пула. Отметка простоя удаляется, потому что id объекта
+        может достаться новому соединению, которое тогда пропустило бы проверку
+        """
+        self._last_used.pop(id(conn), None)
+        self.pool.putconn(conn, close=True)
+
+    @contextmanager
+    def _cursor(self) -> Iterator[cursor]:
+        """
+        Курсор в режиме autocommit: каждый запрос фиксируется сразу
+        """
+        with self._connection() as conn:
+            conn.autocommit = True
+            with conn.cursor(cursor_factory=TimedCursor) as cur:
+                cur.on_executed = self._check_slow_query
+                yield cur
+
+    @contextmanager
+    def _transaction(self, cursor_name: Optional[str] = None) -> Iterator[cursor]:
+        """
+        Открывает транзакцию на время блока: commit при успехе, rollback при ошибке.
+        cursor_name создает именованный (серверный) курсор
+        """
+        with self._connection() as conn:
+            conn.autocommit = False
+            with conn:
+                with conn.cursor(name=cursor_name, cursor_factory=TimedCursor) as cur:
+                    cur.on_executed = self._check_slow_query
+                    yield cur
+
+    def _query(self, query: str, params: Optional[Union[tuple, dict]] = None, retries: int = 1) -> List[tuple]:
+        """
+        Выполняет читающий запрос и возвращает все строки. При обрыве соединения запрос повторяется
+        на новом соединении из пула
+        """
+        for attempt in range(retries + 1):
+            try:
+                with self._cursor() as cur:
+                    cur.execute(query, params)
+                    return cast(List[tuple], cur.fetchall())
+            except (psycopg2.OperationalError, psycopg2.InterfaceError) as e:
+                if attempt == retries:
+                    raise
+                print(f"Соединение с БД потеряно, повторяем запрос: {e}")
+        return []
+
+    def _check_slow_query(
+            self,
+            cur: cursor,
+            query: Union[str, bytes],
+            params: Optional[Union[tuple, dict]],
+            seconds: float
+    ) -> None:
+        """
+        Если запрос дольше порога из metrics, сохраняет его план EXPLAIN ANALYZE. План снимается
+        на том же соединении (видны временные таблицы и данные незавершенной транзакции) и откатывается,
+        поэтому изменяющие запросы не применяются дважды. Для REFRESH MATERIALIZED VIEW
+        разбирается запрос представления, команды без плана (COPY, DDL) пропускаются
+        """
+        if self.metrics is None or self.metrics.slow_query_threshold is None:
+            return
+        if seconds < self.metrics.slow_query_threshold:
+            return
+        conn = cur.connection
+        statement = query.decode(encodings[conn.encoding]) if isinstance(query, bytes) else query
+        refresh = REFRESH_RE.match(statement)
+        if refresh is None and not statement.lstrip().upper().startswith(EXPLAINABLE_STATEMENTS):
+            return
+        explained = statement
+        try:
+            with conn.cursor() as plain:
+                if refresh is not None:
+                    plain.execute('SELECT pg_get_viewdef(%s::regclass);', (refresh.group(1),))
+                    explained, params = plain.fetchone()[0], None
+                plain.execute('BEGIN;' if conn.autocommit else 'SAVEPOINT explain_slow_query;')
+                try:
+                    plain.execute('EXPLAIN (ANALYZE, BUFFERS) ' + explained, params)
+                    plan = '\n'.join(row[0] for row in plain.fetchall())
+                finally:
+                    plain.execute('ROLLBACK;' if conn.autocommit else 'ROLLBACK TO SAVEPOINT explain_slow_query;')
+        except psycopg2.Error as e:
+            print(f"Не удалось получить план медленного запроса: {e}")
+            return
+        self.metrics.record_slow_query(statement, seconds, plan)
+
+    def ping(self) -> bool:
+        """
+        Проверяет доступность базы данных
+        """
+        try:
+            return self._query('SELECT 1;', retries=0) == [(1,)]
+        except psycopg2.Error:
+            return False
+
+    @staticmethod
+    def _vacancy_row(vacancy_data: dict) -> Tuple:
+        """
+        Преобразует вакансию из ответа API в строку таблицы vacancies (порядок VACANCY_COLUMNS)
+        """
+        salary = vacancy_data.get('salary')
+        row = (
+            vacancy_data['id'],
+            vacancy_data['employer']['id'],
+            vacancy_data['name'],
+            salary['from'] if salary else None,
+            salary['to'] if salary else None,
+            salary['currency'] if salary else None,
+            vacancy_data['alternate_url'],
+            vacancy_data.get('published_at')
+        )
+        content_hash = hashlib.md5(json.dumps(row, default=str).encode('utf-8')).hexdigest()
+        return row + (content_hash,)
+
+    def create_tables(self) -> None:
+        """
+        Создает таблицы компаний и вакансий и применяет недостающие миграции схемы
+        """
+        with self._transaction() as cur:
+            cur.execute('''
+            CREATE TABLE IF NOT EXISTS schema_version (
+                version INTEGER PRIMARY KEY,
+                description TEXT,
+                applied_at TIMESTAMPTZ NOT NULL DEFAULT now()
+            );
+            ''')
+            # блокировка не дает нескольким процессам применять миграции одновременно
+            cur.execute('SELECT pg_advisory_xact_lock(hashtext(%s));', ('schema_version',))
+            cur.execute('SELECT COALESCE(MAX(version), 0) FROM schema_version;')
+            current_version: int = cur.fetchone()[0]
+            for version, description, sql in MIGRATIONS:
+                if version <= current_version:
+                    continue
+                print(f"Применяем миграцию {version}: {description}...")
+                cur.execute(sql)
+                cur.execute(
+                    'INSERT INTO schema_version (version, description) VALUES (%s, %s);',
+                    (version, description)
+                )
 
+    @instrumented
     def insert_company(self, company_data: dict) -> None:
         """
         Вставляет данные о компании в таблицу
@@ -67,205 +379,808 @@ class DBManager:
         VALUES (%s, %s, %s)
         ON CONFLICT (company_id) DO NOTHING;
         '''
-        self.cursor.execute(insert_query, (
-            company_data['id'],
-            company_data['name'],
-            company_data.get('url', '')
-        ))
+        with self._cursor() as cur:
+            cur.execute(insert_query, (
+                company_data['id'],
+                company_data['name'],
+                company_data.get('url', '')
+            ))
 
+    @instrumented
     def insert_vacancy(self, vacancy_data: dict) -> None:
         """
         Вставляет данные о вакансии
         """
-        salary_from = vacancy_data['salary']['from'] if vacancy_data['salary'] else None
-        salary_to = vacancy_data['salary']['to'] if vacancy_data['salary'] else None
-        salary_currency = vacancy_data['salary']['currency'] if vacancy_data['salary'] else None
+        insert_query = f'''
+        INSERT INTO vacancies ({', '.join(VACANCY_COLUMNS)})
+        VALUES ({', '.join(['%s'] * len(VACANCY_COLUMNS))})
+        ON CONFLICT (vacancy_id) DO UPDATE SET {VACANCY_UPDATES}
+        WHERE vacancies.content_hash IS DISTINCT FROM EXCLUDED.content_hash;
+        '''
 
-        insert_query = '''
-        INSERT INTO vacancies (vacancy_id, company_id, name, salary_from, salary_to, salary_currency, url)
-        VALUES (%s, %s, %s, %s, %s, %s, %s)
-        ON CONFLICT (vacancy_id) DO NOTHING;
+        with self._cursor() as cur:
+            cur.execute(insert_query, self._vacancy_row(vacancy_data))
+
+    @instrumented
+    def insert_companies_bulk(self, companies: Iterable[dict]) -> int:
+        """
+        Добавляет или обновляет компании одним многострочным запросом
+        """
+        rows = [(company['id'], company['name'], company.get('url', '')) for company in companies]
+        if not rows:
+            return 0
+        upsert_query = '''
+        INSERT INTO companies (company_id, name, url)
+        VALUES %s
+        ON CONFLICT (company_id) DO UPDATE SET name = EXCLUDED.name, url = EXCLUDED.url;
         '''
+        with self._transaction() as cur:
+            execute_values(cur, upsert_query, rows)
+        return len(rows)
 
-        self.cursor.execute(insert_query, (
-            vacancy_data['id'],
-            vacancy_data['employer']['id'],
-            vacancy_data['name'],
-            salary_from,
-            salary_to,
-            salary_currency,
-            vacancy_data['alternate_url']
-        ))
+    @instrumented
+    def insert_vacancies_bulk(self, vacancies: Iterable[dict], batch_size: int = 1000, report: bool = True) -> int:
+        """
+        Загружает вакансии пачками через COPY во временную таблицу и сливает их в vacancies upsert-ом.
+        Вся загрузка идет в одной транзакции. Возвращает число обработанных строк,
+        report=False отключает вывод скорости загрузки
+        """
+        columns = ', '.join(VACANCY_COLUMNS)
+        merge_query = f'''
+        INSERT INTO vacancies ({columns})
+        SELECT DISTINCT ON (vacancy_id) {columns}
+        FROM vacancies_stage
+        ORDER BY vacancy_id
+        ON CONFLICT (vacancy_id) DO UPDATE SET {VACANCY_UPDATES}
+        WHERE vacancies.content_hash IS DISTINCT FROM EXCLUDED.content_hash;
+        '''
 
-    def get_companies_and_vacancies_count(self) -> List[Tuple[str, int]]:
+        # csv пишет None как "", FORCE_NULL превращает такие значения обратно в NULL
+        copy_query = f'''
+        COPY vacancies_stage ({columns}) FROM STDIN
+        WITH (FORMAT csv, FORCE_NULL (salary_from, salary_to, salary_currency, published_at));
+        '''
+
+        started = time.perf_counter()
+        total = 0
+        changed = 0
+        rows_iter = (self._vacancy_row(vacancy) for vacancy in vacancies)
+        with self._transaction() as cur:
+            cur.execute(
+                f'CREATE TEMP TABLE vacancies_stage ON COMMIT DROP AS SELECT {columns} FROM vacancies LIMIT 0;'
+            )
+            while True:
+                batch = list(islice(rows_iter, batch_size))
+                if not batch:
+                    break
+                buffer = io.StringIO()
+                csv.writer(buffer, quoting=csv.QUOTE_NONNUMERIC).writerows(batch)
+                buffer.seek(0)
+                cur.copy_expert(copy_query, buffer)
+                cur.execute(merge_query)
+                changed += cur.rowcount
+                cur.execute('TRUNCATE vacancies_stage;')
+                total += len(batch)
+
+        elapsed = time.perf_counter() - started
+        rate = total / elapsed if elapsed > 0 else 0.0
+        if self.metrics is not None:
+            self.metrics.observe_ingest(total, elapsed)
+        if report:
+            print(
+                f"Записано вакансий: {total} (новых или измененных: {changed}) за {elapsed:.2f} с "
+                f"({rate:.0f} строк/с)"
+            )
+        return total
+
+    @instrumented
+    def get_sync_state(self) -> Dict[int, Tuple[datetime, Optional[int]]]:
         """
-        Возвращает список кортежей с названием компании и количеством вакансий
+        Возвращает отметки синхронизации: id компании -> (время последней синхронизации, число вакансий)
         """
+        rows = self._query('SELECT company_id, last_synced_at, vacancies_count FROM sync_state;')
+        return {row[0]: (row[1], row[2]) for row in rows}
+
+    @instrumented
+    def get_last_sync_time(self, company_ids: List[int]) -> Optional[datetime]:
+        """
+        Возвращает время самой давней синхронизации среди компаний списка
+        или None, если хотя бы одна из них еще не синхронизирована
+        """
+        ids = sorted({int(company_id) for company_id in company_ids})
         query = '''
-        SELECT c.name, COUNT(v.vacancy_id) as vacancies_count
-        FROM companies c
-        LEFT JOIN vacancies v ON c.company_id = v.company_id
-        GROUP BY c.name;
+        SELECT CASE WHEN COUNT(*) = %s THEN MIN(last_synced_at) END
+        FROM sync_state
+        WHERE company_id = ANY(%s);
         '''
-        with self.connection.cursor() as cursor:
-            cursor.execute(query)
-            return cursor.fetchall()
+        return cast(Optional[datetime], self._query(query, (len(ids), ids))[0][0])
 
-    def get_all_vacancies(self) -> List[Tuple[str, str, str, str]]:
+    @instrumented
+    def set_sync_state(self, company_id: int, synced_at: datetime, vacancies_count: Optional[int]) -> None:
         """
-        Возвращает все вакансии с информацией о компании и зарплате.
+        Сохраняет отметку синхронизации компании
         """
         query = '''
-            SELECT c.name AS company_name, v.name AS vacancy_name,
-                   v.salary_from, v.salary_to,
-                   v.url
-            FROM vacancies v
-            JOIN companies c ON v.company_id = c.company_id;
+        INSERT INTO sync_state (company_id, last_synced_at, vacancies_count)
+        VALUES (%s, %s, %s)
+        ON CONFLICT (company_id) DO UPDATE
+        SET last_synced_at = EXCLUDED.last_synced_at, vacancies_count = EXCLUDED.vacancies_count;
         '''
-        with self.connection.cursor() as cursor:
-            cursor.execute(query)
-            results = cursor.fetchall()
-
-        processed_results = []
-        for row in results:
-            company_name = row[0]
-            vacancy_name = row[1]
-            salary_from = row[2]
-            salary_to = row[3]
-            url = row[4]
+        with self._cursor() as cur:
+            cur.execute(query, (company_id, synced_at, vacancies_count))
 
-            try:
-                sf = float(salary_from) if salary_from is not None else None
-                st = float(salary_to) if salary_to is not None else None
-            except (TypeError, ValueError):
-                sf = None
-                st = None
-
-            if sf is not None and st is not None:
-                salary_str = f"от {sf} до {st}"
-            elif sf is not None:
-                salary_str = f"от {sf}"
-            elif st is not None:
-                salary_str = f"до {st}"
-            else:
-                salary_str = "Зарплата не указана"
+    @instrumented
+    def count_company_vacancies(self, company_id: int) -> int:
+        """
+        Возвращает число вакансий компании в базе
+        """
+        return int(self._query('SELECT COUNT(*) FROM vacancies WHERE company_id = %s;', (company_id,))[0][0])
 
-            processed_results.append((company_name, vacancy_name, salary_str, url))
+    @instrumented
+    def delete_vacancies_except(self, company_id: int, keep_ids: Set[int]) -> int:
+        """
+        Удаляет вакансии компании, которых нет в keep_ids (закрытые на hh). Возвращает число удаленных
+        """
+        with self._cursor() as cur:
+            cur.execute(
+                'DELETE FROM vacancies WHERE company_id = %s AND NOT (vacancy_id = ANY(%s));',
+                (company_id, [int(vacancy_id) for vacancy_id in keep_ids])
+            )
+            return int(cur.rowcount)
 
-        return processed_results
+    def delete_vacancies_published_before(
+            self,
+            company_id: int,
+            published_before: datetime,
+            keep_ids: Iterable[int] = ()
+    ) -> int:
+        """
+        Удаляет вакансии компании, опубликованные раньше published_before, кроме keep_ids.
+        Так снимаются закрытые вакансии, когда API не отдает полный список открытых. Возвращает число удаленных
+        """
+        with self._cursor() as cur:
+            cur.execute(
+                'DELETE FROM vacancies WHERE company_id = %s AND published_at < %s AND NOT (vacancy_id = ANY(%s));',
+                (company_id, published_before, [int(vacancy_id) for vacancy_id in keep_ids])
+            )
+            return int(cur.rowcount)
 
-    def get_avg_salary(self) -> Optional[float]:
+    @instrumented
+    def start_ingest_jobs(
+            self,
+            company_ids: List[int],
+            max_attempts: int = 3,
+            lease_seconds: int = 600,
+            restart: bool = False
+    ) -> int:
+        """
+        Ставит работодателей в очередь загрузки. Если незавершенных заданий не осталось (ошибки,
+        исчерпавшие max_attempts попыток, считаются завершенными), начинается новый проход,
+        иначе продолжается прерванный. restart=True заново ставит в очередь с первой страницы все
+        завершенные задания из списка, а незавершенные продолжаются с сохраненной страницы.
+        Задания, чей процесс упал на последней попытке (аренда lease_seconds истекла), помечаются ошибкой.
+        Возвращает число заданий к загрузке
         """
-        Вычисляет среднюю зарплату по вакансиям
+        ids = [int(company_id) for company_id in company_ids]
+        expire_query = '''
+        UPDATE ingest_jobs
+        SET status = 'failed', error = 'Обработчик не завершил задание за отведенные попытки', updated_at = now()
+        WHERE company_id = ANY(%s) AND status = 'running' AND attempts >= %s
+          AND updated_at < now() - %s * interval '1 second';
+        '''
+        unfinished_query = '''
+        SELECT COUNT(*) FROM ingest_jobs
+        WHERE company_id = ANY(%s) AND (status IN ('pending', 'running') OR (status = 'failed' AND attempts < %s));
+        '''
+        restart_query = '''
+        UPDATE ingest_jobs
+        SET status = 'pending', last_page = -1, attempts = 0, error = NULL, updated_at = now()
+        WHERE company_id = ANY(%s) AND (status = 'done' OR (status = 'failed' AND attempts >= %s));
+        '''
+        with self._transaction() as cur:
+            cur.execute('LOCK TABLE ingest_jobs IN SHARE ROW EXCLUSIVE MODE;')
+            execute_values(
+                cur,
+                'INSERT INTO ingest_jobs (company_id) VALUES %s ON CONFLICT (company_id) DO NOTHING;',
+                [(company_id,) for company_id in ids],
+                page_size=1000
+            )
+            cur.execute(expire_query, (ids, max_attempts, lease_seconds))
+            cur.execute(unfinished_query, (ids, max_attempts))
+            unfinished = int(cur.fetchone()[0])
+            if restart or unfinished == 0:
+                cur.execute(restart_query, (ids, max_attempts))
+                cur.execute(unfinished_query, (ids, max_attempts))
+                unfinished = int(cur.fetchone()[0])
+            return unfinished
+
+    @instrumented
+    def claim_ingest_job(self, lease_seconds: int = 600, max_attempts: int = 3) -> Optional[Tuple[int, int]]:
+        """
+        Забирает следующее задание из очереди (SELECT ... FOR UPDATE SKIP LOCKED, поэтому несколько
+        процессов не мешают друг другу). Задания упавших процессов возвращаются в работу по истечении
+        lease_seconds без обновлений, пока не исчерпаны max_attempts попыток.
+        Возвращает (id работодателя, последняя загруженная страница) или None
         """
         query = '''
-            SELECT AVG((v.salary_from::numeric + v.salary_to::numeric)/2.0) AS avg_salary
-            FROM vacancies v
-            WHERE v.salary_from IS NOT NULL AND v.salary_to IS NOT NULL;
+        UPDATE ingest_jobs j
+        SET status = 'running', attempts = j.attempts + 1, updated_at = now()
+        FROM (
+            SELECT company_id
+            FROM ingest_jobs
+            WHERE status = 'pending'
+               OR (status = 'running' AND updated_at < now() - %(lease)s * interval '1 second'
+                   AND attempts < %(max_attempts)s)
+               OR (status = 'failed' AND attempts < %(max_attempts)s)
+            ORDER BY company_id
+            LIMIT 1
+            FOR UPDATE SKIP LOCKED
+        ) AS next_job
+        WHERE j.company_id = next_job.company_id
+        RETURNING j.company_id, j.last_page;
         '''
-        with self.connection.cursor() as cursor:
-            cursor.execute(query)
-            result = cursor.fetchone()
-            return result[0] if result else None
+        with self._transaction() as cur:
+            cur.execute(query, {'lease': lease_seconds, 'max_attempts': max_attempts})
+            row = cur.fetchone()
+        return (row[0], row[1]) if row else None
 
-    def get_vacancies_with_higher_salary(self) -> List[Tuple[str, str, str, str]]:
+    @instrumented
+    def record_ingest_progress(self, company_id: int, page: int) -> None:
         """
-        Возвращает вакансии с зарплатой выше средней
+        Сохраняет номер последней записанной страницы (заодно продлевает аренду задания)
         """
-        avg_salary = self.get_avg_salary()
-        if avg_salary is None:
-            return []
+        with self._cursor() as cur:
+            cur.execute(
+                'UPDATE ingest_jobs SET last_page = %s, updated_at = now() WHERE company_id = %s;',
+                (page, company_id)
+            )
 
+    @instrumented
+    def finish_ingest_job(self, company_id: int, status: str, error: Optional[str] = None) -> None:
+        """
+        Завершает задание со статусом 'done' или 'failed'
+        """
+        with self._cursor() as cur:
+            cur.execute(
+                'UPDATE ingest_jobs SET status = %s, error = %s, updated_at = now() WHERE company_id = %s;',
+                (status, error, company_id)
+            )
+
+    @instrumented
+    def get_ingest_job_counts(self, company_ids: Optional[List[int]] = None) -> Dict[str, int]:
+        """
+        Возвращает число заданий загрузки по статусам (только для company_ids, если список задан)
+        """
         query = '''
-            SELECT c.name AS company_name, v.name AS vacancy_name,
-                   v.salary_from, v.salary_to,
-                   v.url
-            FROM vacancies v
-            JOIN companies c ON v.company_id = c.company_id
-            WHERE 
-                (v.salary_from::numeric > %s OR v.salary_to::numeric > %s)
-                AND (v.salary_from IS NOT NULL OR v.salary_to IS NOT NULL);
+        SELECT status, COUNT(*) FROM ingest_jobs
+        WHERE %(ids)s::integer[] IS NULL OR company_id = ANY(%(ids)s::integer[])
+        GROUP BY status;
         '''
-        with self.connection.cursor() as cursor:
-            cursor.execute(query, (avg_salary, avg_salary))
-            results = cursor.fetchall()
-
-        processed_results = []
-        for row in results:
-            company_name = row[0]
-            vacancy_name = row[1]
-            salary_from = row[2]
-            salary_to = row[3]
-            url = row[4]
+        ids = [int(company_id) for company_id in company_ids] if company_ids is not None else None
+        return dict(self._query(query, {'ids': ids}))
 
-            try:
-                sf = float(salary_from) if salary_from is not None else None
-                st = float(salary_to) if salary_to is not None else None
-            except (TypeError, ValueError):
-                sf = None
-                st = None
-
-            if sf is not None and st is not None:
-                salary_str = f"от {sf} до {st}"
-            elif sf is not None:
-                salary_str = f"от {sf}"
-            elif st is not None:
-                salary_str = f"до {st}"
-            else:
-                salary_str = "Зарплата не указана"
+    @instrumented
+    def get_exchange_rates(self) -> Dict[str, float]:
+        """
+        Возвращает сохраненные курсы валют: код валюты -> сколько единиц валюты в одном рубле
+        """
+        return {currency: float(rate) for currency, rate in self._query('SELECT currency, rate FROM exchange_rates;')}
 
-            processed_results.append((company_name, vacancy_name, salary_str, url))
+    @instrumented
+    def update_exchange_rates(self, rates: Dict[str, float]) -> int:
+        """
+        Сохраняет курсы валют и пересчитывает зарплату в рублях у вакансий в валютах,
+        курс которых изменился. Возвращает число пересчитанных вакансий
+        """
+        rows = [(currency, rate) for currency, rate in rates.items() if rate and rate > 0]
+        if not rows:
+            return 0
+        with self._transaction() as cur:
+            changed = execute_values(
+                cur,
+                '''
+                INSERT INTO exchange_rates (currency, rate) VALUES %s
+                ON CONFLICT (currency) DO UPDATE SET rate = EXCLUDED.rate, updated_at = now()
+                WHERE exchange_rates.rate IS DISTINCT FROM EXCLUDED.rate
+                RETURNING currency;
+                ''',
+                rows,
+                template='(%s, %s::numeric)',
+                fetch=True
+            )
+            if not changed:
+                return 0
+            cur.execute(
+                '''
+                UPDATE vacancies SET salary_rub = salary_to_rub(salary_from, salary_to, salary_currency)
+                WHERE salary_currency = ANY(%s)
+                  AND salary_rub IS DISTINCT FROM salary_to_rub(salary_from, salary_to, salary_currency);
+                ''',
+                ([row[0] for row in changed],)
+            )
+            return int(cur.rowcount)
 
-        return processed_results
+    @instrumented
+    def get_vacancies_for_enrichment(self, after_id: int = 0, limit: int = 100) -> List[Tuple[int, str]]:
+        """
+        Возвращает (id, content_hash) новых или измененных вакансий, детали которых еще не загружены
+        """
+        query = '''
+        SELECT vacancy_id, content_hash
+        FROM vacancies
+        WHERE enriched_hash IS DISTINCT FROM content_hash AND vacancy_id > %s
+        ORDER BY vacancy_id
+        LIMIT %s;
+        '''
+        return self._query(query, (after_id, limit))
 
-    def get_vacancies_with_keyword(self, keyword: str) -> List[Tuple[str, str, str, str]]:
+    @instrumented
+    def update_vacancy_details(self, rows: List[Tuple]) -> int:
         """
-        Возвращает вакансии по ключевому слову в названии
+        Пакетно записывает детали вакансий.
+        Строка: (id, content_hash, описание, город, опыт, тип занятости, график)
         """
-        pattern = f'%{keyword}%'
+        if not rows:
+            return 0
         query = '''
-            SELECT c.name AS company_name, v.name AS vacancy_name,
+        UPDATE vacancies v
+        SET description = d.description,
+            city = d.city,
+            experience = d.experience,
+            employment = d.employment,
+            schedule = d.schedule,
+            enriched_hash = d.content_hash
+        FROM (VALUES %s) AS d(vacancy_id, content_hash, description, city, experience, employment, schedule)
+        WHERE v.vacancy_id = d.vacancy_id;
+        '''
+        with self._transaction() as cur:
+            execute_values(cur, query, rows, template='(%s::bigint, %s, %s, %s, %s, %s, %s)', page_size=len(rows))
+            return int(cur.rowcount)
+
+    @instrumented
+    def refresh_rollups(self) -> None:
+        """
+        Пересчитывает сводные данные по компаниям и зарплатам. Вызывается в конце каждой загрузки;
+        обновление идет конкурентно, поэтому читающие запросы не блокируются
+        """
+        started = time.perf_counter()
+        populated = self._query("SELECT ispopulated FROM pg_matviews WHERE matviewname = 'company_stats';")
+        concurrently = 'CONCURRENTLY' if populated and populated[0][0] else ''
+        with self._cursor() as cur:
+            cur.execute(f'REFRESH MATERIALIZED VIEW {concurrently} company_stats;')
+        print(f"Сводные данные обновлены за {time.perf_counter() - started:.2f} с")
+
+    @instrumented
+    def get_companies_and_vacancies_count(self) -> List[Tuple[str, int]]:
+        """
+        Возвращает список кортежей с названием компании и количеством вакансий
+        """
+        return self._query('SELECT name, vacancies_count FROM company_stats ORDER BY name;')
+
+    def _listing_query(
+            self,
+            where: str = 'TRUE',
+            order_by: str = 'v.vacancy_id',
+            with_clause: str = '',
+            extra_columns: str = ''
+    ) -> str:
+        """
+        Собирает запрос списка вакансий: id, компания, название, зарплата от/до, ссылка
+        и дополнительные колонки extra_columns после них
+        """
+        return f'''
+            {with_clause}
+            SELECT v.vacancy_id, c.name AS company_name, v.name AS vacancy_name,
                    v.salary_from, v.salary_to,
-                   v.url
+                   v.url{extra_columns}
             FROM vacancies v
             JOIN companies c ON v.company_id = c.company_id
-            WHERE v.name ILIKE %s;
+            WHERE {where}
+            ORDER BY {order_by}
         '''
-        with self.connection.cursor() as cursor:
-            cursor.execute(query, (pattern,))
-            results = cursor.fetchall()
-
-        processed_results = []
-        for row in results:
-            company_name = row[0]
-            vacancy_name = row[1]
-            salary_from = row[2]
-            salary_to = row[3]
-            url = row[4]
 
-            try:
-                sf = float(salary_from) if salary_from is not None else None
-                st = float(salary_to) if salary_to is not None else None
-            except (TypeError, ValueError):
-                sf = None
-                st = None
-
-            if sf is not None and st is not None:
-                salary_str = f"от {sf} до {st}"
-            elif sf is not None:
-                salary_str = f"от {sf}"
-            elif st is not None:
-                salary_str = f"до {st}"
+    def _iter_rows(self, query: str, params: Optional[dict], itersize: int) -> Iterator[tuple]:
+        """
+        Потоково читает результат запроса через серверный курсор, отдавая строки по мере получения.
+        Для проверки медленных запросов считается только время чтения из базы, без обработки строк
+        """
+        with self._transaction(cursor_name=f'rows_{uuid.uuid4().hex}') as cur:
+            started = time.perf_counter()
+            cur.execute(query, params)
+            elapsed = time.perf_counter() - started
+            while True:
+                started = time.perf_counter()
+                rows = cur.fetchmany(itersize)
+                elapsed += time.perf_counter() - started
+                if not rows:
+                    break
+                yield from rows
+            self._check_slow_query(cur, query, params, elapsed)
+
+    def _iter_listing(self, query: str, params: Optional[dict], itersize: int) -> Iterator[Tuple[str, str, str, str]]:
+        """
+        Потоково отдает строки списка вакансий: компания, название, зарплата, ссылка
+        """
+        for row in self._iter_rows(query, params, itersize):
+            yield row[1], row[2], format_salary(row[3], row[4]), row[5]
+
+    def _fetch_page(self, query: str, params: dict) -> List[Tuple[int, str, str, str, str]]:
+        """
+        Возвращает одну страницу списка вакансий, первым элементом строки идет id для следующей страницы
+        """
+        return [
+            (row[0], row[1], row[2], format_salary(row[3], row[4]), row[5])
+            for row in self._query(query, params)
+        ]
+
+    @instrumented
+    def iter_all_vacancies(self, itersize: int = 1000) -> Iterator[Tuple[str, str, str, str]]:
+        """
+        Потоково отдает все вакансии с информацией о компании и зарплате
+        """
+        return self._iter_listing(self._listing_query(), None, itersize)
+
+    @instrumented
+    def get_all_vacancies(self) -> List[Tuple[str, str, str, str]]:
+        """
+        Возвращает все вакансии с информацией о компании и зарплате.
+        """
+        return list(self._iter_listing(self._listing_query(), None, 1000))
+
+    @instrumented
+    def get_all_vacancies_page(
+            self,
+            after_id: Optional[int] = None,
+            limit: int = 20
+    ) -> List[Tuple[int, str, str, str, str]]:
+        """
+        Возвращает страницу всех вакансий после вакансии с id after_id (keyset пагинация)
+        """
+        query = self._listing_query(where='v.vacancy_id > %(after_id)s') + ' LIMIT %(limit)s'
+        return self._fetch_page(query, {'after_id': after_id or 0, 'limit': limit})
+
+    @instrumented
+    def get_avg_salary(self) -> Optional[float]:
+        """
+        Вычисляет среднюю зарплату в рублях по вакансиям (по сводным данным компаний).
+        Зарплаты в валюте пересчитываются по exchange_rates, у открытой вилки берется указанная граница
+        """
+        rows = self._query(AVG_SALARY_QUERY)
+        return rows[0][0] if rows else None
+
+    @instrumented
+    def iter_vacancies_with_higher_salary(self, itersize: int = 1000) -> Iterator[Tuple[str, str, str, str]]:
+        """
+        Потоково отдает вакансии с зарплатой выше средней
+        """
+        query = self._listing_query(with_clause=HIGHER_SALARY_CTE, where=HIGHER_SALARY_FILTER)
+        return self._iter_listing(query, None, itersize)
+
+    @instrumented
+    def get_vacancies_with_higher_salary(self) -> List[Tuple[str, str, str, str]]:
+        """
+        Возвращает вакансии с зарплатой выше средней (сравнение в рублях)
+        """
+        query = self._listing_query(with_clause=HIGHER_SALARY_CTE, where=HIGHER_SALARY_FILTER)
+        return list(self._iter_listing(query, None, 1000))
+
+    @instrumented
+    def get_vacancies_with_higher_salary_page(
+            self,
+            after_id: Optional[int] = None,
+            limit: int = 20
+    ) -> List[Tuple[int, str, str, str, str]]:
+        """
+        Возвращает страницу вакансий с зарплатой выше средней после вакансии с id after_id
+        """
+        query = self._listing_query(
+            with_clause=HIGHER_SALARY_CTE, where=f'({HIGHER_SALARY_FILTER}) AND v.vacancy_id > %(after_id)s'
+        ) + ' LIMIT %(limit)s'
+        return self._fetch_page(query, {'after_id': after_id or 0, 'limit': limit})
+
+    @staticmethod
+    def keyword_params(keyword: str) -> dict:
+        """
+        Параметры поиска: исходная строка для полнотекстового поиска и экранированный шаблон для ILIKE
+        """
+        escaped = keyword.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+        return {'keyword': keyword, 'pattern': f'%{escaped}%'}
+
+    @instrumented
+    def iter_vacancies_with_keyword(self, keyword: str, itersize: int = 1000) -> Iterator[Tuple[str, str, str, str]]:
+        """
+        Потоково отдает вакансии по ключевому слову в порядке релевантности
+        """
+        query = self._listing_query(
+            with_clause=KEYWORD_QUERY_CTE, where=KEYWORD_FILTER, order_by=KEYWORD_RANK_ORDER
+        )
+        return self._iter_listing(query, self.keyword_params(keyword), itersize)
+
+    @instrumented
+    def get_vacancies_with_keyword(
+            self,
+            keyword: str,
+            limit: Optional[int] = None,
+            offset: int = 0
+    ) -> List[Tuple[str, str, str, str]]:
+        """
+        Возвращает вакансии по ключевому слову: полнотекстовый поиск (русский и английский)
+        по названию и описанию плюс поиск подстроки в названии по триграммному индексу.
+        Результаты отсортированы по релевантности, limit/offset задают страницу выдачи
+        """
+        query = self._listing_query(
+            with_clause=KEYWORD_QUERY_CTE, where=KEYWORD_FILTER, order_by=KEYWORD_RANK_ORDER
+        ) + ' LIMIT %(limit)s OFFSET %(offset)s'
+        params = dict(self.keyword_params(keyword), limit=limit, offset=offset)
+        return [row[1:] for row in self._fetch_page(query, params)]
+
+    @instrumented
+    def get_vacancies_with_keyword_page(
+            self,
+            keyword: str,
+            after: Optional[Tuple[float, int]] = None,
+            limit: int = 20
+    ) -> List[Tuple[Tuple[float, int], str, str, str, str]]:
+        """
+        Возвращает страницу вакансий по ключевому слову в порядке релевантности после вакансии
+        с ключом after. Ключ (ранг, id) идет первым элементом строки и передается за следующей страницей
+        """
+        query = self._listing_query(
+            with_clause=KEYWORD_QUERY_CTE,
+            where=f'({KEYWORD_FILTER}) AND {KEYWORD_AFTER_FILTER}',
+            order_by=KEYWORD_RANK_ORDER,
+            extra_columns=f', {KEYWORD_RANK}'
+        ) + ' LIMIT %(limit)s'
+        after_rank, after_id = after or (None, None)
+        params = dict(self.keyword_params(keyword), after_rank=after_rank, after_id=after_id, limit=limit)
+        return [
+            ((row[6], row[0]), row[1], row[2], format_salary(row[3], row[4]), row[5])
+            for row in self._query(query, params)
+        ]
+
+    @staticmethod
+    def _salary_dimension_expressions(dimensions: Sequence[str]) -> List[str]:
+        """
+        Выражения группировки для разрезов зарплат, неизвестные разрезы - ошибка
+        """
+        unknown = [dimension for dimension in dimensions if dimension not in SALARY_DIMENSIONS]
+        if unknown:
+            raise ValueError(
+                f"Неизвестный разрез: {', '.join(unknown)}, ожидается один из: {', '.join(SALARY_DIMENSIONS)}"
+            )
+        return [SALARY_DIMENSIONS[dimension] for dimension in dimensions]
+
+    @instrumented
+    def get_salary_distribution(
+            self,
+            dimensions: Sequence[str],
+            percentiles: Sequence[float],
+            min_count: int = 1
+    ) -> List[tuple]:
+        """
+        Распределение зарплат в рублях за один проход (GROUPING SETS) по всем вакансиям и каждому разрезу:
+        строки (GROUPING, значения разрезов..., число вакансий, средняя, массив перцентилей).
+        Группы, где меньше min_count вакансий, пропускаются
+        """
+        expressions = self._salary_dimension_expressions(dimensions)
+        grouping_sets = ', '.join([f'({expression})' for expression in expressions] + ['()'])
+        grouping = f"GROUPING({', '.join(expressions)})" if expressions else '0'
+        key_columns = ''.join(f'{expression}, ' for expression in expressions)
+        query = f'''
+        SELECT {grouping} AS grouping_id, {key_columns}
+               COUNT(*),
+               AVG(v.salary_rub)::float8,
+               percentile_cont(%(percentiles)s::float8[]) WITHIN GROUP (ORDER BY v.salary_rub)
+        FROM vacancies v
+        JOIN companies c ON c.company_id = v.company_id
+        WHERE v.salary_rub IS NOT NULL
+        GROUP BY GROUPING SETS ({grouping_sets})
+        HAVING COUNT(*) >= %(min_count)s
+        ORDER BY 1, COUNT(*) DESC
+        '''
+        return self._query(query, {'percentiles': list(percentiles), 'min_count': min_count})
+
+    @instrumented
+    def get_salary_histogram(
+            self,
+            buckets: int,
+            low: Optional[float] = None,
+            high: Optional[float] = None,
+            dimension: Optional[str] = None
+    ) -> List[Tuple[Optional[str], int, float, float, int]]:
+        """
+        Непустые корзины гистограммы зарплат в рублях: (значение разреза, номер корзины с 1, нижняя
+        и верхняя граница гистограммы, число вакансий). Границы общие для всех групп разреза -
+        по умолчанию 1-й и 99-й перцентили всех зарплат, выбросы попадают в крайние корзины.
+        Без dimension значение разреза - 'all'
+        """
+        key = self._salary_dimension_expressions([dimension])[0] if dimension else "'all'"
+        query = f'''
+        WITH bounds AS (
+            SELECT COALESCE(%(low)s, percentile_cont(0.01) WITHIN GROUP (ORDER BY salary_rub)) AS low,
+                   COALESCE(%(high)s, percentile_cont(0.99) WITHIN GROUP (ORDER BY salary_rub)) AS high
+            FROM vacancies
+            WHERE salary_rub IS NOT NULL
+        )
+        SELECT {key}::text,
+               LEAST(GREATEST(width_bucket(v.salary_rub::float8, b.low, b.high, %(buckets)s), 1), %(buckets)s),
+               MIN(b.low), MIN(b.high), COUNT(*)
+        FROM vacancies v
+        JOIN companies c ON c.company_id = v.company_id
+        CROSS JOIN bounds b
+        WHERE v.salary_rub IS NOT NULL AND b.high > b.low
+        GROUP BY 1, 2
+        ORDER BY 1, 2
+        '''
+        return self._query(query, {'low': low, 'high': high, 'buckets': buckets})
+
+    @instrumented
+    def get_history_partitions(self) -> List[str]:
+        """
+        Возвращает имена секций vacancy_history по возрастанию имени
+        """
+        rows = self._query('''
+            SELECT child.relname
+            FROM pg_inherits
+            JOIN pg_class parent ON parent.oid = pg_inherits.inhparent
+            JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+            WHERE parent.relname = 'vacancy_history'
+            ORDER BY child.relname;
+        ''')
+        return [row[0] for row in rows]
+
+    def create_history_partition(self, name: str, start: date, end: date) -> None:
+        """
+        Создает секцию vacancy_history name для снимков с start (включительно) до end
+        """
+        with self._cursor() as cur:
+            cur.execute(
+                f'CREATE TABLE IF NOT EXISTS {name} PARTITION OF vacancy_history '
+                f"FOR VALUES FROM ('{start:%Y-%m-%d} 00:00+00') TO ('{end:%Y-%m-%d} 00:00+00');"
+            )
+
+    def drop_history_partition(self, name: str) -> None:
+        """
+        Отсоединяет и удаляет секцию vacancy_history name целиком
+        """
+        with self._cursor() as cur:
+            cur.execute(f'ALTER TABLE vacancy_history DETACH PARTITION {name};')
+            cur.execute(f'DROP TABLE {name};')
+
+    @instrumented
+    def insert_history_snapshot(self, captured_at: datetime) -> int:
+        """
+        Добавляет в историю текущее состояние всех вакансий одним запросом INSERT ... SELECT.
+        Возвращает число записанных строк
+        """
+        with self._cursor() as cur:
+            cur.execute('''
+                INSERT INTO vacancy_history (captured_at, vacancy_id, company_id, salary_from, salary_to,
+                                             salary_currency, salary_rub)
+                SELECT %s, vacancy_id, company_id, salary_from, salary_to, salary_currency, salary_rub
+                FROM vacancies
+                ON CONFLICT DO NOTHING;
+            ''', (captured_at,))
+            return int(cur.rowcount)
+
+    @instrumented
+    def get_history_trends(
+            self,
+            bucket: str,
+            since: datetime,
+            until: datetime,
+            company_id: Optional[int] = None
+    ) -> List[Tuple[datetime, str, float, Optional[float], Optional[float]]]:
+        """
+        Тренды по компаниям за период [since, until), сгруппированные по date_trunc(bucket):
+        (период, компания, среднее число открытых вакансий на снимок, средняя и медианная зарплата в рублях)
+        """
+        query = '''
+        SELECT date_trunc(%(bucket)s, h.captured_at, 'UTC') AS period,
+               c.name,
+               (COUNT(*)::float8 / COUNT(DISTINCT h.captured_at)) AS vacancies,
+               AVG(h.salary_rub)::float8,
+               percentile_cont(0.5) WITHIN GROUP (ORDER BY h.salary_rub)
+        FROM vacancy_history h
+        JOIN companies c ON c.company_id = h.company_id
+        WHERE h.captured_at >= %(since)s AND h.captured_at < %(until)s
+          AND (%(company_id)s::integer IS NULL OR h.company_id = %(company_id)s::integer)
+        GROUP BY 1, c.name
+        ORDER BY c.name, 1
+        '''
+        params = {'bucket': bucket, 'since': since, 'until': until, 'company_id': company_id}
+        return self._query(query, params)
+
+    def export_query(self, filter_name: str = 'all', keyword: Optional[str] = None,
+                     numeric_as_float: bool = False) -> Tuple[str, dict]:
+        """
+        Собирает запрос выгрузки вакансий с фильтром: все вакансии, зарплата выше средней или ключевое слово.
+        numeric_as_float приводит зарплаты NUMERIC к float8 (иначе они приходят в Python как Decimal)
+        """
+        numeric = '::float8' if numeric_as_float else ''
+        if filter_name == 'all':
+            query = EXPORT_QUERY.format(with_clause='', where='TRUE', order_by='v.vacancy_id', numeric=numeric)
+            return query, {}
+        if filter_name == 'higher-salary':
+            query = EXPORT_QUERY.format(
+                with_clause=HIGHER_SALARY_CTE, where=HIGHER_SALARY_FILTER, order_by='v.vacancy_id', numeric=numeric
+            )
+            return query, {}
+        if filter_name == 'keyword':
+            if not keyword:
+                raise ValueError("Для фильтра keyword нужно ключевое слово")
+            query = EXPORT_QUERY.format(
+                with_clause=KEYWORD_QUERY_CTE, where=KEYWORD_FILTER, order_by=KEYWORD_RANK_ORDER, numeric=numeric
+            )
+            return query, self.keyword_params(keyword)
+        raise ValueError(f"Неизвестный фильтр '{filter_name}', ожидается один из: {', '.join(EXPORT_FILTERS)}")
+
+    @instrumented
+    def copy_query_to(self, f: BinaryIO, query: str, params: Optional[dict] = None, fmt: str = 'csv') -> int:
+        """
+        Выгружает результат запроса командой COPY ... TO STDOUT прямо в файл f: CSV с заголовком
+        или JSONL (объект row_to_json на строку). Возвращает число строк
+        """
+        if fmt not in COPY_FORMATS:
+            raise ValueError(f"Неизвестный формат COPY '{fmt}', ожидается один из: {', '.join(COPY_FORMATS)}")
+        with self._transaction() as cur:
+            # COPY не принимает параметры, поэтому подставляем их на стороне клиента с экранированием
+            bound = cur.mogrify(query, params).decode(encodings[cur.connection.encoding])
+            if fmt == 'csv':
+                copy_query = f'COPY ({bound}) TO STDOUT WITH (FORMAT csv, HEADER)'
             else:
-                salary_str = "Зарплата не указана"
+                bound = f'SELECT row_to_json(t) FROM ({bound}) t'
+                copy_query = f'COPY ({bound}) TO STDOUT WITH ({JSONL_COPY_OPTIONS})'
+            started = time.perf_counter()
+            cur.copy_expert(copy_query, f)
+            # у COPY нет плана - при медленной выгрузке разбирается ее внутренний запрос
+            self._check_slow_query(cur, bound, None, time.perf_counter() - started)
+            return int(cur.rowcount)
 
-            processed_results.append((company_name, vacancy_name, salary_str, url))
+    @instrumented
+    def iter_snapshot_rows(self, itersize: int = 50000) -> Iterator[tuple]:
+        """
+        Потоково отдает данные для снимка базы из одной транзакции REPEATABLE READ, чтобы компании
+        и вакансии были согласованы: сначала строки ('company', id, название) по возрастанию id,
+        затем ('vacancy', id, id компании, название, зарплата от, до, в рублях, валюта, ссылка) по возрастанию id
+        """
+        query = '''
+            SELECT v.vacancy_id, v.company_id, v.name, v.salary_from::float8, v.salary_to::float8,
+                   v.salary_rub::float8, v.salary_currency, v.url
+            FROM vacancies v
+            ORDER BY v.vacancy_id
+        '''
+        with self._transaction(cursor_name=f'snapshot_{uuid.uuid4().hex}') as cur:
+            with cur.connection.cursor(cursor_factory=TimedCursor) as plain:
+                plain.on_executed = self._check_slow_query
+                plain.execute('SET TRANSACTION ISOLATION LEVEL REPEATABLE READ READ ONLY;')
+                plain.execute('SELECT company_id, name FROM companies ORDER BY company_id;')
+                companies = plain.fetchall()
+            for company_id, name in companies:
+                yield 'company', company_id, name
+            started = time.perf_counter()
+            cur.execute(query)
+            elapsed = time.perf_counter() - started
+            while True:
+                started = time.perf_counter()
+                rows = cur.fetchmany(itersize)
+                elapsed += time.perf_counter() - started
+                if not rows:
+                    break
+                for row in rows:
+                    yield ('vacancy',) + row
+            self._check_slow_query(cur, query, None, elapsed)
 
-        return processed_results
+    @instrumented
+    def iter_query(self, query: str, params: Optional[dict] = None, itersize: int = 1000) -> Iterator[tuple]:
+        """
+        Потоково отдает строки произвольного читающего запроса через серверный курсор,
+        читая их из базы порциями по itersize строк
+        """
+        return self._iter_rows(query, params, itersize)
 
     def close(self) -> None:
         """
-        Закрывает соединение с базой данных
+        Закрывает все соединения пула
         """
-        self.cursor.close()
-        self.connection.close()
+        self.pool.closeall()
@@ -0,0 +1,95 @@
+import html
+import re
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+from modules.api_module import APIClient
+from modules.db_module import DBManager
+
+TAG_RE = re.compile(r'<[^>]+>')
+SPACE_RE = re.compile(r'\s+')
+
+
+class VacancyEnricher:
+    """
+    Догружает детали (описание, город, опыт, занятость, график) для новых и измененных вакансий
+    """
+
+    def __init__(
+            self,
+            api_client: APIClient,
+            db_manager: DBManager,
+            max_workers: int = 4,
+            batch_size: int = 100
+    ) -> None:
+        """
+        max_workers - сколько запросов деталей выполняется одновременно,
+        batch_size - сколько вакансий записывается в базу за раз
+        """
+        self.api_client: APIClient = api_client
+        self.db_manager: DBManager = db_manager
+        self.max_workers: int = max(1, max_workers)
+        self.batch_size: int = batch_size
+
+    @staticmethod
+    def _clean_description(description: Optional[str]) -> Optional[str]:
+        """
+        Убирает HTML разметку из описания вакансии
+        """
+        if not description:
+            return None
+        return SPACE_RE.sub(' ', html.unescape(TAG_RE.sub(' ', description))).strip()
+
+    @staticmethod
+    def _name(details: Dict, field: str) -> Optional[str]:
+        """
+        Возвращает название из справочного поля ответа ({'id': ..., 'name': ...})
+        """
+        value = details.get(field)
+        return value.get('name') if isinstance(value, dict) else None
+
+    def _details_row(self, vacancy_id: int, content_hash: str, details: Dict) -> Tuple:
+        """
+        Преобразует детали вакансии в строку для DBManager.update_vacancy_details
+        """
+        address = details.get('address') or {}
+        return (
+            vacancy_id,
+            content_hash,
+            self._clean_description(details.get('description')),
+            address.get('city') or self._name(details, 'area'),
+            self._name(details, 'experience'),
+            self._name(details, 'employment'),
+            self._name(details, 'schedule')
+        )
+
+    def run(self, limit: Optional[int] = None) -> int:
+        """
+        Обходит вакансии без актуальных деталей пачками по batch_size. Отметка обогащения пишется
+        вместе с деталями, поэтому прерванный запуск продолжится с необработанных вакансий.
+        Возвращает число обновленных вакансий
+        """
+        enriched = 0
+        processed = 0
+        after_id = 0
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            while limit is None or processed < limit:
+                batch_size = self.batch_size if limit is None else min(self.batch_size, limit - processed)
+                pending: List[Tuple[int, str]] = self.db_manager.get_vacancies_for_enrichment(after_id, batch_size)
+                if not pending:
+                    break
+                after_id = pending[-1][0]
+                # вакансия попала сюда, потому что изменилась, - кэшированные детали могут быть старыми
+                details = executor.map(
+                    lambda vacancy_id: self.api_client.get_vacancy_details(vacancy_id, revalidate=True),
+                    [row[0] for row in pending]
+                )
+                rows = [
+                    self._details_row(vacancy_id, content_hash, vacancy_details)
+                    for (vacancy_id, content_hash), vacancy_details in zip(pending, details)
+                    if vacancy_details is not None
+                ]
+                enriched += self.db_manager.update_vacancy_details(rows)
+                processed += len(pending)
+                print(f"Детали загружены для {enriched} из {processed} вакансий...")
+        return enriched
@@ -0,0 +1,113 @@
+import gzip
+import os
+from itertools import islice
+from typing import BinaryIO, Optional, Tuple, cast
+
+from modules.db_module import DBManager
+
+FORMATS = ('csv', 'jsonl', 'parquet')
+
+
+class VacancyExporter:
+    """
+    Потоковая выгрузка вакансий из Postgres в CSV, JSONL (через COPY ... TO STDOUT) и Parquet.
+    Строки не накапливаются в памяти: COPY пишет прямо в файл, Parquet пишется группами строк
+    """
+
+    def __init__(self, db_manager: DBManager, chunk_size: int = 50000) -> None:
+        """
+        chunk_size - строк в одной группе Parquet файла
+        """
+        self.db_manager: DBManager = db_manager
+        self.chunk_size: int = chunk_size
+
+    @staticmethod
+    def detect_format(path: str) -> Tuple[str, bool]:
+        """
+        Определяет формат и сжатие по расширению файла: vacancies.csv.gz -> ('csv', True)
+        """
+        compress = path.endswith('.gz')
+        extension = os.path.splitext(path[:-3] if compress else path)[1].lstrip('.').lower()
+        if extension not in FORMATS:
+            raise ValueError(f"Неизвестный формат выгрузки '{extension}', ожидается один из: {', '.join(FORMATS)}")
+        return extension, compress
+
+    def _write_parquet(self, filter_name: str, keyword: Optional[str], path: str) -> int:
+        """
+        Читает результат серверным курсором порциями по chunk_size строк и пишет каждую порцию
+        отдельной группой строк Parquet файла
+        """
+        # pyarrow импортируется только здесь: его загрузка занимает ~100 мс, остальным командам он не нужен
+        try:
+            import pyarrow  # type: ignore[import-untyped]
+            import pyarrow.parquet  # type: ignore[import-untyped]
+        except ImportError:
+            raise RuntimeError("Для выгрузки в Parquet нужен пакет pyarrow: pip install pyarrow")
+        schema = pyarrow.schema([
+            ('vacancy_id', pyarrow.int64()),
+            ('company_id', pyarrow.int64()),
+            ('company_name', pyarrow.string()),
+            ('name', pyarrow.string()),
+            ('salary_from', pyarrow.float64()),
+            ('salary_to', pyarrow.float64()),
+            ('salary_currency', pyarrow.string()),
+            ('city', pyarrow.string()),
+            ('experience', pyarrow.string()),
+            ('employment', pyarrow.string()),
+            ('schedule', pyarrow.string()),
+            ('url', pyarrow.string()),
+            ('published_at', pyarrow.timestamp('us', tz='UTC')),
+        ])
+        query, params = self.db_manager.export_query(filter_name, keyword, numeric_as_float=True)
+        rows = self.db_manager.iter_query(query, params, self.chunk_size)
+        total = 0
+        with pyarrow.parquet.ParquetWriter(path, schema, compression='zstd') as writer:
+            while chunk := list(islice(rows, self.chunk_size)):
+                columns = list(zip(*chunk))
+                writer.write_table(pyarrow.Table.from_arrays(
+                    [pyarrow.array(column, type=field.type) for column, field in zip(columns, schema)],
+                    schema=schema
+                ))
+                total += len(chunk)
+            if total == 0:
+                writer.write_table(schema.empty_table())
+        return total
+
+    def export(
+            self,
+            path: str,
+            filter_name: str = 'all',
+            keyword: Optional[str] = None,
+            fmt: Optional[str] = None,
+            compress: Optional[bool] = None
+    ) -> int:
+        """
+        Выгружает вакансии в файл и возвращает число строк. Формат и gzip сжатие по умолчанию
+        определяются по расширению (.csv, .jsonl, .parquet, с суффиксом .gz для csv/jsonl)
+        """
+        if fmt is None:
+            fmt, detected_compress = self.detect_format(path)
+        else:
+            detected_compress = path.endswith('.gz')
+        compress = detected_compress if compress is None else compress
+
+        if fmt not in FORMATS:
+            raise ValueError(f"Неизвестный формат выгрузки '{fmt}', ожидается один из: {', '.join(FORMATS)}")
+        if fmt == 'parquet' and compress:
+            raise ValueError("Parquet сжимается внутри файла, gzip для него не поддерживается")
+
+        # пишем во временный файл, чтобы прерванная выгрузка не оставила обрезанный файл
+        tmp_path = f'{path}.tmp'
+        try:
+            if fmt == 'parquet':
+                rows = self._write_parquet(filter_name, keyword, tmp_path)
+            else:
+                query, params = self.db_manager.export_query(filter_name, keyword)
+                f = cast(BinaryIO, gzip.open(tmp_path, 'wb', compresslevel=6) if compress else open(tmp_path, 'wb'))
+                with f:
+                    rows = self.db_manager.copy_query_to(f, query, params, fmt)
+            os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        return rows
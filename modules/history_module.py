@@ -0,0 +1,119 @@
+import re
+from datetime import date, datetime, timezone
+from typing import List, Optional, Tuple
+
+from modules.db_module import DBManager
+
+PARTITION_PREFIX = 'vacancy_history_p'
+PARTITION_RE = re.compile(rf'^{PARTITION_PREFIX}(\d{{4}})(\d{{2}})$')
+TREND_BUCKETS = ('day', 'week', 'month')
+
+
+def _month_start(value: date) -> date:
+    """
+    Первое число месяца
+    """
+    return date(value.year, value.month, 1)
+
+
+def _add_months(value: date, months: int) -> date:
+    """
+    Сдвигает первое число месяца на months месяцев
+    """
+    month = value.year * 12 + value.month - 1 + months
+    return date(month // 12, month % 12 + 1, 1)
+
+
+class HistoryManager:
+    """
+    История вакансий: после каждой синхронизации в vacancy_history добавляется снимок всех вакансий.
+    Таблица разбита на секции по месяцам - запросы трендов за период читают только нужные секции,
+    а старая история удаляется отсоединением и удалением целых секций вместо DELETE
+    """
+
+    def __init__(self, db_manager: DBManager, retention_months: Optional[int] = 24) -> None:
+        """
+        retention_months - сколько месяцев истории хранить (None - хранить всю)
+        """
+        self.db_manager: DBManager = db_manager
+        self.retention_months: Optional[int] = retention_months
+
+    def ensure_partitions(self, start: date, months: int = 2) -> List[str]:
+        """
+        Создает месячные секции начиная с месяца start (текущий и следующий по умолчанию),
+        чтобы запись снимка на границе месяцев не упала. Возвращает имена созданных секций
+        """
+        existing = set(self.get_partitions())
+        created: List[str] = []
+        month = _month_start(start)
+        for _ in range(months):
+            name = f'{PARTITION_PREFIX}{month:%Y%m}'
+            next_month = _add_months(month, 1)
+            if name not in existing:
+                self.db_manager.create_history_partition(name, month, next_month)
+                created.append(name)
+            month = next_month
+        return created
+
+    def get_partitions(self) -> List[str]:
+        """
+        Возвращает имена секций vacancy_history по возрастанию месяца
+        """
+        return self.db_manager.get_history_partitions()
+
+    def record_snapshot(self, captured_at: Optional[datetime] = None) -> int:
+        """
+        Добавляет в историю текущее состояние всех вакансий одним запросом INSERT ... SELECT.
+        Возвращает число записанных строк
+        """
+        captured_at = captured_at or datetime.now(timezone.utc)
+        self.ensure_partitions(captured_at.astimezone(timezone.utc).date())
+        return self.db_manager.insert_history_snapshot(captured_at)
+
+    def apply_retention(self, today: Optional[date] = None) -> List[str]:
+        """
+        Отсоединяет и удаляет секции целиком старше retention_months месяцев.
+        Возвращает имена удаленных секций
+        """
+        if self.retention_months is None:
+            return []
+        cutoff = _add_months(_month_start(today or datetime.now(timezone.utc).date()), -self.retention_months)
+        dropped: List[str] = []
+        for name in self.get_partitions():
+            match = PARTITION_RE.match(name)
+            if match is None or date(int(match.group(1)), int(match.group(2)), 1) >= cutoff:
+                continue
+            self.db_manager.drop_history_partition(name)
+            dropped.append(name)
+        if dropped:
+            print(f"Удалена история до {cutoff:%Y-%m}: {', '.join(dropped)}")
+        return dropped
+
+    def record_after_sync(self) -> int:
+        """
+        Записывает снимок после синхронизации и применяет срок хранения истории
+        """
+        rows = self.record_snapshot()
+        self.apply_retention()
+        print(f"В историю записано вакансий: {rows}")
+        return rows
+
+    def get_trends(
+            self,
+            company_id: Optional[int] = None,
+            since: Optional[datetime] = None,
+            until: Optional[datetime] = None,
+            bucket: str = 'month'
+    ) -> List[Tuple[datetime, str, float, Optional[float], Optional[float]]]:
+        """
+        Тренды по компаниям: (период, компания, среднее число открытых вакансий на снимок,
+        средняя и медианная зарплата в рублях). Период since/until ограничивает читаемые секции
+        """
+        if bucket not in TREND_BUCKETS:
+            raise ValueError(f"Неизвестный период '{bucket}', ожидается один из: {', '.join(TREND_BUCKETS)}")
+        return self.db_manager.get_history_trends(
+            bucket,
+            since or datetime(1970, 1, 1, tzinfo=timezone.utc),
+            until or datetime(9999, 1, 1, tzinfo=timezone.utc),
+            company_id
+        )
@@ -0,0 +1,120 @@
+import multiprocessing
+import re
+from typing import Dict, List, Optional
+
+from modules.api_module import APIClient
+from modules.db_module import DBManager
+from modules.pipeline_module import IngestPipeline
+
+MAX_ATTEMPTS = 3
+
+
+def load_company_ids(path: str) -> List[int]:
+    """
+    Читает id работодателей из файла: по одному или через запятую/пробел, строки с # пропускаются
+    """
+    company_ids: List[int] = []
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            line = line.split('#', 1)[0]
+            company_ids.extend(int(value) for value in re.split(r'[\s,;]+', line) if value)
+    return company_ids
+
+
+def _run_pipeline(api_client: APIClient, db_manager: DBManager, lease_seconds: int, batch_size: int) -> None:
+    """
+    Обрабатывает очередь заданий конвейером из api_client.max_workers загрузчиков и одного писателя
+    """
+    IngestPipeline(
+        api_client,
+        db_manager,
+        batch_size=batch_size,
+        lease_seconds=lease_seconds,
+        max_attempts=MAX_ATTEMPTS
+    ).run()
+
+
+def _worker_main(db_params: Dict, api_params: Dict, lease_seconds: int, batch_size: int) -> None:
+    """
+    Точка входа процесса-обработчика: свои соединения с API и базой
+    """
+    api_client = APIClient(**api_params)
+    db_manager = DBManager(**db_params, max_connections=api_client.max_workers + 1)
+    try:
+        _run_pipeline(api_client, db_manager, lease_seconds, batch_size)
+    finally:
+        db_manager.close()
+        api_client.close()
+
+
+class IngestJobRunner:
+    """
+    Загрузка большого списка работодателей через очередь заданий в Postgres: прогресс сохраняется
+    по страницам, работа делится между процессами, перезапуск продолжает с места остановки
+    """
+
+    def __init__(
+            self,
+            api_client: APIClient,
+            db_manager: DBManager,
+            db_params: Optional[Dict] = None,
+            processes: int = 1,
+            lease_seconds: int = 600,
+            batch_size: int = 1000
+    ) -> None:
+        """
+        db_params - параметры DBManager для дочерних процессов (нужны при processes > 1).
+        Лимит частоты запросов api_client делится между процессами поровну
+        """
+        if processes > 1 and db_params is None:
+            raise ValueError("Для нескольких процессов нужны параметры подключения db_params")
+        self.api_client: APIClient = api_client
+        self.db_manager: DBManager = db_manager
+        self.db_params: Optional[Dict] = db_params
+        self.processes: int = max(1, processes)
+        self.lease_seconds: int = lease_seconds
+        self.batch_size: int = batch_size
+
+    def _api_params(self) -> Dict:
+        """
+        Параметры APIClient для дочерних процессов
+        """
+        return {
+            'base_url': self.api_client.base_url,
+            'max_workers': self.api_client.max_workers,
+            'rate_limit': self.api_client.rate_limiter.rate / self.processes,
+            'burst': max(1, self.api_client.rate_limiter.capacity // self.processes),
+            'timeout': self.api_client.timeout,
+            'max_retries': self.api_client.max_retries,
+        }
+
+    def run(self, company_ids: List[int], restart: bool = False) -> Dict[str, int]:
+        """
+        Загружает работодателей из списка и возвращает число их заданий по статусам.
+        По умолчанию продолжает прерванный проход, restart=True заново загружает уже завершенные задания
+        """
+        pending = self.db_manager.start_ingest_jobs(company_ids, MAX_ATTEMPTS, self.lease_seconds, restart)
+        print(f"Заданий к загрузке: {pending} (процессов: {self.processes})")
+
+        if self.processes == 1:
+            _run_pipeline(self.api_client, self.db_manager, self.lease_seconds, self.batch_size)
+        else:
+            workers = [
+                multiprocessing.Process(
+                    target=_worker_main,
+                    args=(self.db_params, self._api_params(), self.lease_seconds, self.batch_size)
+                )
+                for _ in range(self.processes)
+            ]
+            for worker in workers:
+                worker.start()
+            for worker in workers:
+                worker.join()
+            crashed = sum(1 for worker in workers if worker.exitcode != 0)
+            if crashed:
+                print(f"Загрузка прервана: {self.db_manager.get_ingest_job_counts(company_ids)}")
+                raise RuntimeError(f"Процессов загрузки завершилось с ошибкой: {crashed} из {self.processes}")
+
+        counts = self.db_manager.get_ingest_job_counts(company_ids)
+        print(f"Загрузка завершена: {counts}")
+        return counts
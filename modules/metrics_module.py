@@ -0,0 +1,221 @@
+import atexit
+import functools
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple, TypeVar, cast
+
+DEFAULT_BUCKETS: Tuple[float, ...] = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+Labels = Tuple[Tuple[str, str], ...]
+F = TypeVar('F', bound=Callable[..., Any])
+
+
+class Histogram:
+    """
+    Гистограмма с фиксированными границами корзин в формате Prometheus
+    """
+
+    def __init__(self, buckets: Tuple[float, ...] = DEFAULT_BUCKETS) -> None:
+        self.buckets: Tuple[float, ...] = buckets
+        self.counts: List[int] = [0] * (len(buckets) + 1)
+        self.sum: float = 0.0
+        self.count: int = 0
+
+    def observe(self, value: float) -> None:
+        """
+        Добавляет наблюдение
+        """
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Metrics:
+    """
+    Потокобезопасный сборщик метрик APIClient и DBManager с выгрузкой в Prometheus textfile и JSON
+    """
+
+    def __init__(self, slow_query_threshold: Optional[float] = None) -> None:
+        """
+        slow_query_threshold - порог в секундах, после которого для запроса сохраняется EXPLAIN ANALYZE
+        """
+        self.slow_query_threshold: Optional[float] = slow_query_threshold
+        self.histograms: Dict[Tuple[str, Labels], Histogram] = {}
+        self.counters: Dict[Tuple[str, Labels], float] = {}
+        self.slow_queries: List[Dict] = []
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _labels(labels: Dict[str, object]) -> Labels:
+        return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+    def observe(self, name: str, value: float, **labels: object) -> None:
+        """
+        Добавляет наблюдение в гистограмму name
+        """
+        key = (name, self._labels(labels))
+        with self._lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram()
+            histogram.observe(value)
+
+    def inc(self, name: str, value: float = 1, **labels: object) -> None:
+        """
+        Увеличивает счетчик name
+        """
+        key = (name, self._labels(labels))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe_http(self, endpoint: str, seconds: float, status: object, size: int) -> None:
+        """
+        Учитывает HTTP запрос: задержку по эндпоинту, код ответа и объем данных
+        """
+        self.observe('hh_http_request_seconds', seconds, endpoint=endpoint)
+        self.inc('hh_http_responses_total', endpoint=endpoint, status=status)
+        self.inc('hh_http_response_bytes_total', size, endpoint=endpoint)
+
+    def observe_rate_limit_wait(self, seconds: float) -> None:
+        """
+        Учитывает ожидание в ограничителе частоты запросов
+        """
+        self.observe('hh_rate_limit_wait_seconds', seconds)
+
+    def observe_query(self, method: str, seconds: float, rows: Optional[int]) -> None:
+        """
+        Учитывает вызов метода DBManager: время выполнения и число строк
+        """
+        self.observe('db_query_seconds', seconds, method=method)
+        self.inc('db_queries_total', method=method)
+        if rows is not None:
+            self.inc('db_rows_total', rows, method=method)
+
+    def observe_ingest(self, rows: int, seconds: float) -> None:
+        """
+        Учитывает загрузку вакансий в базу
+        """
+        self.inc('ingest_rows_total', rows)
+        self.inc('ingest_seconds_total', seconds)
+
+    def record_slow_query(self, query: str, seconds: float, plan: str) -> None:
+        """
+        Сохраняет медленный запрос вместе с планом выполнения
+        """
+        with self._lock:
+            self.slow_queries.append({'query': query.strip(), 'seconds': seconds, 'plan': plan})
+        print(f"Медленный запрос ({seconds * 1000:.0f} мс):\n{plan}")
+
+    @staticmethod
+    def _format_labels(labels: Labels, extra: Optional[Tuple[str, str]] = None) -> str:
+        items = list(labels) + ([extra] if extra else [])
+        if not items:
+            return ''
+        return '{' + ','.join(f'{key}="{value}"' for key, value in items) + '}'
+
+    def to_prometheus(self) -> str:
+        """
+        Возвращает метрики в текстовом формате Prometheus
+        """
+        lines: List[str] = []
+        with self._lock:
+            for (name, labels), value in sorted(self.counters.items()):
+                lines.append(f'{name}{self._format_labels(labels)} {value}')
+            for (name, labels), histogram in sorted(self.histograms.items(), key=lambda item: item[0]):
+                cumulative = 0
+                for bound, count in zip(histogram.buckets + (float('inf'),), histogram.counts):
+                    cumulative += count
+                    le = '+Inf' if bound == float('inf') else repr(bound)
+                    lines.append(f'{name}_bucket{self._format_labels(labels, ("le", le))} {cumulative}')
+                lines.append(f'{name}_sum{self._format_labels(labels)} {histogram.sum}')
+                lines.append(f'{name}_count{self._format_labels(labels)} {histogram.count}')
+        return '\n'.join(lines) + '\n'
+
+    def to_dict(self) -> Dict:
+        """
+        Возвращает сводку метрик для JSON
+        """
+        with self._lock:
+            counters = [
+                {'name': name, 'labels': dict(labels), 'value': value}
+                for (name, labels), value in sorted(self.counters.items())
+            ]
+            histograms = [
+                {
+                    'name': name,
+                    'labels': dict(labels),
+                    'count': histogram.count,
+                    'sum': histogram.sum,
+                    'avg': histogram.sum / histogram.count if histogram.count else None,
+                    'buckets': dict(zip([str(b) for b in histogram.buckets] + ['+Inf'], histogram.counts)),
+                }
+                for (name, labels), histogram in sorted(self.histograms.items(), key=lambda item: item[0])
+            ]
+            slow_queries = list(self.slow_queries)
+        return {'counters': counters, 'histograms': histograms, 'slow_queries': slow_queries}
+
+    @staticmethod
+    def _write_atomic(path: str, content: str) -> None:
+        tmp_path = f'{path}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(content)
+        os.replace(tmp_path, path)
+
+    def export(self, prometheus_path: Optional[str] = None, json_path: Optional[str] = None) -> None:
+        """
+        Записывает метрики в файлы (textfile для node_exporter и/или JSON сводку)
+        """
+        if prometheus_path:
+            self._write_atomic(prometheus_path, self.to_prometheus())
+        if json_path:
+            self._write_atomic(json_path, json.dumps(self.to_dict(), ensure_ascii=False, indent=2, default=str))
+
+    def export_at_exit(self, prometheus_path: Optional[str] = None, json_path: Optional[str] = None) -> None:
+        """
+        Регистрирует выгрузку метрик при завершении процесса
+        """
+        atexit.register(self.export, prometheus_path, json_path)
+
+
+def instrumented(method: F) -> F:
+    """
+    Декоратор метода DBManager: замеряет время и число строк результата, если у объекта есть metrics.
+    Для генераторов время и строки считаются по мере чтения до конца
+    """
+    name = method.__name__
+
+    @functools.wraps(method)
+    def wrapper(self: Any, *args: Any, **kwargs: Any) -> Any:
+        metrics: Optional[Metrics] = getattr(self, 'metrics', None)
+        if metrics is None:
+            return method(self, *args, **kwargs)
+        started = time.perf_counter()
+        result = method(self, *args, **kwargs)
+        if isinstance(result, Iterator):
+            return _count_iterator(metrics, name, result, started)
+        if isinstance(result, (list, tuple)):
+            rows: Optional[int] = len(result)
+        elif isinstance(result, int) and not isinstance(result, bool):
+            rows = result
+        else:
+            rows = None
+        metrics.observe_query(name, time.perf_counter() - started, rows)
+        return result
+
+    return cast(F, wrapper)
+
+
+def _count_iterator(metrics: Metrics, name: str, iterator: Iterator, started: float) -> Iterator:
+    """
+    Пропускает строки итератора, по завершении записывая время и число строк
+    """
+    rows = 0
+    try:
+        for row in iterator:
+            rows += 1
+            yield row
+    finally:
+        metrics.observe_query(name, time.perf_counter() - started, rows)
@@ -0,0 +1,168 @@
+from typing import List, Tuple
+
+# Версионированные миграции схемы: (версия, описание, SQL).
+# Применяются по порядку в DBManager.create_tables, уже примененные версии хранятся в schema_version.
+# Первые миграции идемпотентны, чтобы корректно обновлять базы, созданные до появления версий
+MIGRATIONS: List[Tuple[int, str, str]] = [
+    (1, 'Базовые таблицы компаний и вакансий', '''
+        CREATE TABLE IF NOT EXISTS companies (
+            id SERIAL PRIMARY KEY,
+            company_id INTEGER UNIQUE NOT NULL,
+            name TEXT NOT NULL,
+            url TEXT
+        );
+
+        CREATE TABLE IF NOT EXISTS vacancies (
+            vacancy_id SERIAL PRIMARY KEY,
+            name TEXT NOT NULL,
+            description TEXT,
+            company_id INTEGER REFERENCES companies(company_id),
+            url TEXT,
+            salary_from TEXT,
+            salary_to TEXT,
+            salary_currency TEXT,
+            city TEXT,
+            experience TEXT,
+            employment TEXT,
+            schedule TEXT
+        );
+    '''),
+    (2, 'Отметки инкрементальной синхронизации', '''
+        ALTER TABLE vacancies ADD COLUMN IF NOT EXISTS published_at TIMESTAMPTZ;
+        ALTER TABLE vacancies ADD COLUMN IF NOT EXISTS content_hash TEXT;
+
+        CREATE TABLE IF NOT EXISTS sync_state (
+            company_id INTEGER PRIMARY KEY REFERENCES companies(company_id),
+            last_synced_at TIMESTAMPTZ NOT NULL,
+            vacancies_count INTEGER
+        );
+    '''),
+    (3, 'Числовые зарплаты, id вакансии hh как первичный ключ и индексы', '''
+        ALTER TABLE vacancies
+            ALTER COLUMN salary_from TYPE NUMERIC USING NULLIF(salary_from::text, '')::numeric,
+            ALTER COLUMN salary_to TYPE NUMERIC USING NULLIF(salary_to::text, '')::numeric,
+            ALTER COLUMN vacancy_id DROP DEFAULT,
+            ALTER COLUMN vacancy_id TYPE BIGINT;
+        DROP SEQUENCE IF EXISTS vacancies_vacancy_id_seq;
+
+        CREATE INDEX IF NOT EXISTS vacancies_company_id_idx ON vacancies (company_id);
+        CREATE INDEX IF NOT EXISTS vacancies_salary_from_idx ON vacancies (salary_from)
+            WHERE salary_from IS NOT NULL;
+        CREATE INDEX IF NOT EXISTS vacancies_salary_to_idx ON vacancies (salary_to)
+            WHERE salary_to IS NOT NULL;
+    '''),
+    (4, 'Полнотекстовый и триграммный поиск по вакансиям', '''
+        CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+        ALTER TABLE vacancies ADD COLUMN IF NOT EXISTS search_vector tsvector GENERATED ALWAYS AS (
+            setweight(to_tsvector('russian', coalesce(name, '')), 'A')
+            || setweight(to_tsvector('english', coalesce(name, '')), 'A')
+            || setweight(to_tsvector('russian', coalesce(description, '')), 'B')
+            || setweight(to_tsvector('english', coalesce(description, '')), 'B')
+        ) STORED;
+
+        CREATE INDEX IF NOT EXISTS vacancies_search_vector_idx ON vacancies USING gin (search_vector);
+        CREATE INDEX IF NOT EXISTS vacancies_name_trgm_idx ON vacancies USING gin (name gin_trgm_ops);
+    '''),
+    (5, 'Сводные данные по компаниям и зарплатам', '''
+        CREATE MATERIALIZED VIEW IF NOT EXISTS company_stats AS
+        SELECT c.company_id,
+               c.name,
+               COUNT(v.vacancy_id) AS vacancies_count,
+               COUNT(*) FILTER (WHERE v.salary_from IS NOT NULL AND v.salary_to IS NOT NULL) AS salary_count,
+               SUM((v.salary_from + v.salary_to) / 2.0) AS salary_sum,
+               AVG((v.salary_from + v.salary_to) / 2.0) AS avg_salary,
+               MIN(v.salary_from) AS min_salary_from,
+               MAX(v.salary_to) AS max_salary_to
+        FROM companies c
+        LEFT JOIN vacancies v ON c.company_id = v.company_id
+        GROUP BY c.company_id, c.name;
+
+        CREATE UNIQUE INDEX IF NOT EXISTS company_stats_company_id_idx ON company_stats (company_id);
+    '''),
+    (6, 'Отметка обогащения вакансий деталями', '''
+        ALTER TABLE vacancies ADD COLUMN IF NOT EXISTS enriched_hash TEXT;
+
+        CREATE INDEX IF NOT EXISTS vacancies_enrichment_pending_idx ON vacancies (vacancy_id)
+            WHERE enriched_hash IS DISTINCT FROM content_hash;
+    '''),
+    (7, 'Очередь заданий загрузки с прогрессом по работодателям', '''
+        CREATE TABLE IF NOT EXISTS ingest_jobs (
+            company_id INTEGER PRIMARY KEY,
+            status TEXT NOT NULL DEFAULT 'pending' CHECK (status IN ('pending', 'running', 'done', 'failed')),
+            last_page INTEGER NOT NULL DEFAULT -1,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            error TEXT,
+            updated_at TIMESTAMPTZ NOT NULL DEFAULT now()
+        );
+
+        CREATE INDEX IF NOT EXISTS ingest_jobs_status_idx ON ingest_jobs (status, company_id);
+    '''),
+    (8, 'Курсы валют и зарплата в рублях', '''
+        CREATE TABLE IF NOT EXISTS exchange_rates (
+            currency TEXT PRIMARY KEY,
+            rate NUMERIC NOT NULL CHECK (rate > 0),
+            updated_at TIMESTAMPTZ NOT NULL DEFAULT now()
+        );
+        INSERT INTO exchange_rates (currency, rate) VALUES ('RUR', 1) ON CONFLICT (currency) DO NOTHING;
+
+        -- rate из справочника hh: сколько единиц валюты в одном рубле.
+        -- Для вилки берется середина, для открытой вилки - указанная граница
+        CREATE OR REPLACE FUNCTION salary_to_rub(NUMERIC, NUMERIC, TEXT) RETURNS NUMERIC
+        LANGUAGE sql STABLE AS $$
+            SELECT round(COALESCE(($1 + $2) / 2, $1, $2) / (SELECT rate FROM exchange_rates WHERE currency = $3), 2)
+        $$;
+
+        CREATE OR REPLACE FUNCTION vacancies_set_salary_rub() RETURNS trigger
+        LANGUAGE plpgsql AS $$
+        BEGIN
+            NEW.salary_rub := salary_to_rub(NEW.salary_from, NEW.salary_to, NEW.salary_currency);
+            RETURN NEW;
+        END
+        $$;
+
+        ALTER TABLE vacancies ADD COLUMN IF NOT EXISTS salary_rub NUMERIC;
+        DROP TRIGGER IF EXISTS vacancies_salary_rub ON vacancies;
+        CREATE TRIGGER vacancies_salary_rub
+            BEFORE INSERT OR UPDATE OF salary_from, salary_to, salary_currency ON vacancies
+            FOR EACH ROW EXECUTE FUNCTION vacancies_set_salary_rub();
+        UPDATE vacancies SET salary_rub = salary_to_rub(salary_from, salary_to, salary_currency)
+        WHERE salary_from IS NOT NULL OR salary_to IS NOT NULL;
+        CREATE INDEX IF NOT EXISTS vacancies_salary_rub_idx ON vacancies (salary_rub) WHERE salary_rub IS NOT NULL;
+        -- фильтры по зарплате теперь идут по salary_rub, а старые индексы только замедляли upsert
+        DROP INDEX IF EXISTS vacancies_salary_from_idx;
+        DROP INDEX IF EXISTS vacancies_salary_to_idx;
+
+        DROP MATERIALIZED VIEW IF EXISTS company_stats;
+        CREATE MATERIALIZED VIEW company_stats AS
+        SELECT c.company_id,
+               c.name,
+               COUNT(v.vacancy_id) AS vacancies_count,
+               COUNT(v.salary_rub) AS salary_count,
+               SUM(v.salary_rub) AS salary_sum,
+               AVG(v.salary_rub) AS avg_salary,
+               percentile_cont(0.5) WITHIN GROUP (ORDER BY v.salary_rub) AS median_salary,
+               MIN(v.salary_rub) AS min_salary,
+               MAX(v.salary_rub) AS max_salary
+        FROM companies c
+        LEFT JOIN vacancies v ON c.company_id = v.company_id
+        GROUP BY c.company_id, c.name;
+
+        CREATE UNIQUE INDEX IF NOT EXISTS company_stats_company_id_idx ON company_stats (company_id);
+    '''),
+    (9, 'История вакансий по месяцам', '''
+        -- секции по месяцам создает и удаляет HistoryManager
+        CREATE TABLE IF NOT EXISTS vacancy_history (
+            captured_at TIMESTAMPTZ NOT NULL,
+            vacancy_id BIGINT NOT NULL,
+            company_id INTEGER NOT NULL,
+            salary_from NUMERIC,
+            salary_to NUMERIC,
+            salary_currency TEXT,
+            salary_rub NUMERIC,
+            PRIMARY KEY (vacancy_id, captured_at)
+        ) PARTITION BY RANGE (captured_at);
+
+        CREATE INDEX IF NOT EXISTS vacancy_history_company_idx ON vacancy_history (company_id, captured_at);
+    '''),
+]
@@ -0,0 +1,263 @@
+import queue
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Set, Tuple
+
+from modules.api_module import DEEP_PAGINATION_LIMIT, VACANCY_MAX_AGE, APIClient, APIError
+from modules.db_module import DBManager
+
+STOP = None
+
+
+class IngestPipeline:
+    """
+    Конвейер загрузки: потоки-загрузчики забирают задания из ingest_jobs и кладут страницы вакансий
+    в ограниченную очередь, единственный писатель сливает накопившиеся страницы в базу одной пачкой.
+    Когда база не успевает, очередь заполняется и загрузчики ждут (обратное давление).
+    После обхода всех страниц с первой вакансии компании, которых не было в выдаче, удаляются как закрытые
+    """
+
+    def __init__(
+            self,
+            api_client: APIClient,
+            db_manager: DBManager,
+            fetchers: Optional[int] = None,
+            queue_size: int = 32,
+            batch_size: int = 1000,
+            lease_seconds: int = 600,
+            max_attempts: int = 3
+    ) -> None:
+        """
+        fetchers - число потоков загрузки (по умолчанию api_client.max_workers),
+        queue_size - сколько страниц может ждать записи, batch_size - строк в одной записи
+        """
+        self.api_client: APIClient = api_client
+        self.db_manager: DBManager = db_manager
+        self.fetchers: int = max(1, fetchers or api_client.max_workers)
+        self.batch_size: int = batch_size
+        self.lease_seconds: int = lease_seconds
+        self.max_attempts: int = max_attempts
+        self.queue: queue.Queue = queue.Queue(maxsize=queue_size)
+        self.stats: Dict[str, float] = {
+            'companies': 0, 'failed': 0, 'deleted': 0,
+            'fetched_pages': 0, 'fetched_rows': 0, 'fetch_seconds': 0.0, 'fetch_blocked_seconds': 0.0,
+            'write_batches': 0, 'written_rows': 0, 'write_seconds': 0.0, 'write_idle_seconds': 0.0,
+        }
+        self._stats_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._error: Optional[BaseException] = None
+
+    def _count(self, key: str, value: float = 1) -> None:
+        """
+        Увеличивает счетчик статистики конвейера
+        """
+        with self._stats_lock:
+            self.stats[key] += value
+
+    def _put(self, item: Tuple) -> bool:
+        """
+        Кладет элемент в очередь, ожидая места. Возвращает False, если конвейер останавливается
+        """
+        started = time.perf_counter()
+        try:
+            while not self._stop.is_set():
+                try:
+                    self.queue.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+        finally:
+            self._count('fetch_blocked_seconds', time.perf_counter() - started)
+
+    def _fail(self, error: BaseException) -> None:
+        """
+        Запоминает первую ошибку стадии, чтобы run() поднял ее после остановки конвейера
+        """
+        with self._stats_lock:
+            if self._error is None:
+                self._error = error
+
+    def _fetch(self) -> None:
+        """
+        Стадия загрузки: берет задания, пока они есть, и отдает страницы писателю.
+        Любая ошибка задания помечает его как failed. Ошибки API ожидаемы (задание повторится
+        при следующем запуске), остальные - ошибки базы, неожиданный ответ - поднимаются из run()
+        """
+        while not self._stop.is_set():
+            try:
+                job = self.db_manager.claim_ingest_job(self.lease_seconds, self.max_attempts)
+            except Exception as e:
+                print(f"Не удалось взять задание загрузки: {e}")
+                self._fail(e)
+                return
+            if job is None:
+                return
+            company_id, last_page = job
+            try:
+                if not self._fetch_job(company_id, last_page):
+                    return
+            except Exception as e:
+                print(f"Ошибка загрузки компании {company_id}: {e}")
+                self._put(('failed', company_id, str(e) or type(e).__name__))
+                if not isinstance(e, APIError):
+                    self._fail(e)
+
+    def _fetch_job(self, company_id: int, last_page: int) -> bool:
+        """
+        Загружает компанию и ее вакансии со страницы после last_page.
+        Возвращает False, если конвейер остановился до конца задания
+        """
+        started_at = datetime.now(timezone.utc)
+        # закрытые вакансии можно найти только при обходе с первой страницы, а не после чекпоинта
+        seen_ids: Optional[Set[int]] = set() if last_page < 0 else None
+        started = time.perf_counter()
+        company: Optional[Dict] = self.api_client.get_company(company_id)
+        self._count('fetch_seconds', time.perf_counter() - started)
+        if company is None:
+            raise APIError(f"Не удалось получить данные о компании {company_id}")
+        if not self._put(('company', company)):
+            return False
+
+        pages = self.api_client.iter_vacancy_pages(company_id, start_page=last_page + 1, strict=True)
+        page = last_page + 1
+        while True:
+            started = time.perf_counter()
+            vacancies = next(pages, None)
+            self._count('fetch_seconds', time.perf_counter() - started)
+            if vacancies is None:
+                break
+            self._count('fetched_pages')
+            self._count('fetched_rows', len(vacancies))
+            if seen_ids is not None:
+                seen_ids.update(int(vacancy['id']) for vacancy in vacancies)
+            if not self._put(('page', company_id, page, vacancies)):
+                return False
+            page += 1
+        return self._put(('done', company_id, started_at, seen_ids))
+
+    def _flush(self, items: List[Tuple]) -> None:
+        """
+        Записывает накопленные элементы: компании, затем вакансии одной пачкой, затем прогресс
+        страниц и завершение заданий - только после того, как их данные уже в базе
+        """
+        started = time.perf_counter()
+        companies = [item[1] for item in items if item[0] == 'company']
+        if companies:
+            self.db_manager.insert_companies_bulk(companies)
+        vacancies = [vacancy for item in items if item[0] == 'page' for vacancy in item[3]]
+        if vacancies:
+            self.db_manager.insert_vacancies_bulk(vacancies, self.batch_size, report=False)
+        last_pages: Dict[int, int] = {}
+        for item in items:
+            if item[0] == 'page':
+                last_pages[item[1]] = item[2]
+        for company_id, page in last_pages.items():
+            self.db_manager.record_ingest_progress(company_id, page)
+        for item in items:
+            if item[0] == 'done':
+                _, company_id, started_at, seen_ids = item
+                if seen_ids is not None and len(seen_ids) < DEEP_PAGINATION_LIMIT:
+                    self._count('deleted', self.db_manager.delete_vacancies_except(company_id, seen_ids))
+                elif seen_ids is not None:
+                    # API отдает не больше DEEP_PAGINATION_LIMIT вакансий - не увиденные в обходе могут быть
+                    # открыты, поэтому удаляются только вакансии старше срока публикации
+                    self._count('deleted', self.db_manager.delete_vacancies_published_before(
+                        company_id, started_at - VACANCY_MAX_AGE, seen_ids
+                    ))
+                self.db_manager.finish_ingest_job(company_id, 'done')
+                self.db_manager.set_sync_state(company_id, started_at,
+                                               self.db_manager.count_company_vacancies(company_id))
+                self._count('companies')
+            elif item[0] == 'failed':
+                self.db_manager.finish_ingest_job(item[1], 'failed', item[2])
+                self._count('failed')
+        self._count('write_batches')
+        self._count('written_rows', len(vacancies))
+        self._count('write_seconds', time.perf_counter() - started)
+
+    def _write(self) -> None:
+        """
+        Стадия записи: ждет элемент, добирает из очереди все, что успело накопиться (до batch_size строк),
+        и записывает одной пачкой
+        """
+        try:
+            finished = False
+            while not finished:
+                started = time.perf_counter()
+                item = self.queue.get()
+                self._count('write_idle_seconds', time.perf_counter() - started)
+                items: List[Tuple] = []
+                rows = 0
+                while True:
+                    if item is STOP:
+                        finished = True
+                        break
+                    items.append(item)
+                    if item[0] == 'page':
+                        rows += len(item[3])
+                    if rows >= self.batch_size:
+                        break
+                    try:
+                        item = self.queue.get_nowait()
+                    except queue.Empty:
+                        break
+                if items:
+                    self._flush(items)
+        except BaseException as e:
+            self._fail(e)
+            self._stop.set()
+
+    def run(self) -> Dict[str, float]:
+        """
+        Обрабатывает очередь заданий до конца и возвращает статистику стадий.
+        При прерывании загрузчики останавливаются, а уже загруженные страницы дописываются в базу.
+        Ошибка записи или неожиданная ошибка загрузки поднимается после остановки конвейера
+        """
+        started = time.perf_counter()
+        writer = threading.Thread(target=self._write, name='ingest-writer')
+        fetchers = [
+            threading.Thread(target=self._fetch, name=f'ingest-fetcher-{number}')
+            for number in range(self.fetchers)
+        ]
+        writer.start()
+        for fetcher in fetchers:
+            fetcher.start()
+        try:
+            for fetcher in fetchers:
+                fetcher.join()
+        finally:
+            self._stop.set()
+            for fetcher in fetchers:
+                fetcher.join()
+            if writer.is_alive():
+                self.queue.put(STOP)
+            writer.join()
+        if self._error is not None:
+            raise self._error
+
+        elapsed = time.perf_counter() - started
+        self.stats['elapsed_seconds'] = elapsed
+        self.print_stats()
+        return self.stats
+
+    def print_stats(self) -> None:
+        """
+        Выводит пропускную способность стадий конвейера
+        """
+        stats = self.stats
+        fetch_rate = stats['fetched_rows'] / stats['fetch_seconds'] if stats['fetch_seconds'] else 0.0
+        write_rate = stats['written_rows'] / stats['write_seconds'] if stats['write_seconds'] else 0.0
+        print(
+            f"Загрузка: {stats['fetched_pages']:.0f} страниц, {stats['fetched_rows']:.0f} вакансий, "
+            f"{fetch_rate:.0f} строк/с на поток, ожидание очереди {stats['fetch_blocked_seconds']:.2f} с"
+        )
+        print(
+            f"Запись: {stats['write_batches']:.0f} пачек, {stats['written_rows']:.0f} вакансий, "
+            f"{write_rate:.0f} строк/с, простой {stats['write_idle_seconds']:.2f} с"
+        )
+        print(
+            f"Компаний загружено: {stats['companies']:.0f}, с ошибками: {stats['failed']:.0f}, "
+            f"удалено закрытых вакансий: {stats['deleted']:.0f}, всего {stats.get('elapsed_seconds', 0.0):.2f} с"
+        )
@@ -0,0 +1,59 @@
+import threading
+import time
+
+
+class TokenBucket:
+    """
+    Потокобезопасный ограничитель частоты запросов (token bucket)
+    """
+
+    def __init__(self, rate: float = 5.0, capacity: int = 5) -> None:
+        """
+        rate - сколько токенов пополняется в секунду, capacity - максимальный запас токенов
+        """
+        if rate <= 0 or capacity <= 0:
+            raise ValueError("rate и capacity должны быть больше нуля")
+        self.rate: float = rate
+        self.capacity: int = capacity
+        self._tokens: float = float(capacity)
+        self._updated_at: float = time.monotonic()
+        self._paused_until: float = 0.0
+        self._lock = threading.Lock()
+
+    def _refill(self) -> None:
+        """
+        Пополняет запас токенов пропорционально прошедшему времени
+        """
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.rate)
+        self._updated_at = now
+
+    def pause(self, seconds: float) -> None:
+        """
+        Приостанавливает выдачу токенов на seconds секунд (например, по Retry-After ответа 429).
+        Запас токенов сбрасывается и после паузы накапливается заново, без всплеска
+        """
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+            self._tokens = 0.0
+            self._updated_at = self._paused_until
+
+    def acquire(self) -> float:
+        """
+        Забирает один токен, при необходимости ожидая его появления или конца паузы.
+        Возвращает время ожидания в секундах
+        """
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    delay = self._paused_until - now
+                else:
+                    self._refill()
+                    if self._tokens >= 1:
+                        self._tokens -= 1
+                        return waited
+                    delay = (1 - self._tokens) / self.rate
+            time.sleep(delay)
+            waited += delay
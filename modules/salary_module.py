@@ -0,0 +1,100 @@
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from modules.api_module import APIClient
+from modules.db_module import SALARY_DIMENSIONS, DBManager
+
+PERCENTILES: Tuple[float, ...] = (0.1, 0.25, 0.5, 0.75, 0.9)
+DIMENSIONS: Dict[str, str] = SALARY_DIMENSIONS
+
+
+def update_exchange_rates(api_client: APIClient, db_manager: DBManager) -> bool:
+    """
+    Обновляет курсы валют из справочников hh. Если API недоступен, остаются сохраненные курсы.
+    Возвращает True, если курсы получены
+    """
+    rates = api_client.get_currency_rates()
+    if not rates:
+        print("Курсы валют не получены, используются сохраненные")
+        return False
+    recalculated = db_manager.update_exchange_rates(rates)
+    if recalculated:
+        print(f"Курсы валют обновлены, зарплата в рублях пересчитана у {recalculated} вакансий")
+    return True
+
+
+class SalaryAnalytics:
+    """
+    Аналитика зарплат в рублях (vacancies.salary_rub): средние, перцентили и гистограммы
+    по компаниям, городам и опыту. Все считается одним запросом на стороне Postgres
+    """
+
+    def __init__(self, db_manager: DBManager) -> None:
+        self.db_manager: DBManager = db_manager
+
+    def distribution(
+            self,
+            dimensions: Sequence[str] = tuple(DIMENSIONS),
+            percentiles: Sequence[float] = PERCENTILES,
+            min_count: int = 1
+    ) -> Dict[str, List[Dict]]:
+        """
+        Считает число вакансий с зарплатой, среднюю и перцентили по всем вакансиям ('all')
+        и по каждому разрезу из dimensions за один проход (GROUPING SETS).
+        Группы, где меньше min_count вакансий, пропускаются
+        """
+        rows = self.db_manager.get_salary_distribution(dimensions, percentiles, min_count)
+
+        # в GROUPING бит выставлен для выражений, не входящих в набор группировки;
+        # старший бит соответствует первому выражению
+        all_bits = (1 << len(dimensions)) - 1
+        names = {all_bits: 'all'}
+        for position, dimension in enumerate(dimensions):
+            names[all_bits & ~(1 << (len(dimensions) - 1 - position))] = dimension
+        result: Dict[str, List[Dict]] = {'all': [], **{dimension: [] for dimension in dimensions}}
+        for row in rows:
+            name = names[row[0]]
+            key = None if name == 'all' else row[1 + list(dimensions).index(name)]
+            count, avg, quantiles = row[-3:]
+            result[name].append({
+                'key': key,
+                'count': count,
+                'avg': avg,
+                'percentiles': dict(zip(percentiles, quantiles)),
+            })
+        return result
+
+    def summary(self, percentiles: Sequence[float] = PERCENTILES) -> Optional[Dict]:
+        """
+        Сводка по всем вакансиям с зарплатой: число, средняя и перцентили
+        """
+        rows = self.distribution(dimensions=(), percentiles=percentiles)['all']
+        return rows[0] if rows else None
+
+    def histogram(
+            self,
+            buckets: int = 10,
+            low: Optional[float] = None,
+            high: Optional[float] = None,
+            dimension: Optional[str] = None
+    ) -> Dict[Optional[str], List[Tuple[float, float, int]]]:
+        """
+        Гистограммы зарплат в рублях: {группа: [(нижняя граница, верхняя граница, число вакансий)]}.
+        Без dimension - одна гистограмма 'all' по всем вакансиям, иначе по каждому значению разреза
+        (компании, города, опыта) с общими границами, чтобы группы можно было сравнивать.
+        По умолчанию границы - 1-й и 99-й перцентили, выбросы попадают в крайние корзины
+        """
+        rows = self.db_manager.get_salary_histogram(buckets, low, high, dimension)
+        if not rows:
+            return {}
+        low_bound, high_bound = rows[0][2], rows[0][3]
+        width = (high_bound - low_bound) / buckets
+        counts: Dict[Optional[str], Dict[int, int]] = {}
+        for key, bucket, _, _, count in rows:
+            counts.setdefault(key, {})[bucket] = count
+        return {
+            key: [
+                (low_bound + (bucket - 1) * width, low_bound + bucket * width, group.get(bucket, 0))
+                for bucket in range(1, buckets + 1)
+            ]
+            for key, group in counts.items()
+        }
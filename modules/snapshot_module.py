@@ -0,0 +1,239 @@
+import json
+import os
+import re
+from array import array
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple, Union
+
+from modules.db_module import DBManager, format_salary
+
+try:
+    import numpy
+    HAS_NUMPY = True
+except ImportError:
+    HAS_NUMPY = False
+
+SNAPSHOT_VERSION = 2
+TOKEN_RE = re.compile(r'\w+')
+
+# Колонки снимка: числовые массивы, смещения строк и их UTF-8 буферы, индекс слов названий
+COLUMNS = (
+    'vacancy_id', 'company_code', 'currency_code', 'salary_from', 'salary_to', 'salary_rub',
+    'name_offsets', 'name_data', 'url_offsets', 'url_data',
+    'token_offsets', 'token_data', 'posting_offsets', 'postings',
+)
+
+
+def _require_numpy() -> None:
+    """
+    Проверяет, что установлен numpy
+    """
+    if not HAS_NUMPY:
+        raise RuntimeError("Для снимков базы нужен пакет numpy: pip install numpy")
+
+
+def _save(path: str, name: str, values: Union[array, bytearray], dtype: str) -> None:
+    """
+    Сохраняет колонку в файл .npy
+    """
+    numpy.save(os.path.join(path, f'{name}.npy'), numpy.frombuffer(values, dtype=dtype))
+
+
+def create_snapshot(db_manager: DBManager, path: str, chunk_size: int = 50000) -> int:
+    """
+    Сохраняет компании и вакансии в каталог path в колоночном виде (файлы .npy и meta.json):
+    зарплаты (и зарплата в рублях) - массивы float64 (NaN вместо NULL), компании и валюты - коды словаря,
+    названия и ссылки - смещения плюс UTF-8 буфер, плюс индекс слов названий. Возвращает число вакансий
+    """
+    _require_numpy()
+    os.makedirs(path, exist_ok=True)
+
+    vacancy_ids = array('q')
+    company_codes = array('i')
+    currency_codes = array('h')
+    salaries_from = array('d')
+    salaries_to = array('d')
+    salaries_rub = array('d')
+    name_offsets, name_data = array('q', [0]), bytearray()
+    url_offsets, url_data = array('q', [0]), bytearray()
+    postings: Dict[str, array] = {}
+    currencies: Dict[str, int] = {}
+
+    companies: Dict[int, str] = {}
+    company_index: Dict[int, int] = {}
+    # строки компаний идут перед вакансиями, все из одной транзакции
+    for row in db_manager.iter_snapshot_rows(chunk_size):
+        if row[0] == 'company':
+            company_index[row[1]] = len(companies)
+            companies[row[1]] = row[2]
+            continue
+        _, vacancy_id, company_id, name, salary_from, salary_to, salary_rub, currency, url = row
+        row_number = len(vacancy_ids)
+        vacancy_ids.append(vacancy_id)
+        company_codes.append(company_index[company_id])
+        currency_codes.append(-1 if currency is None else currencies.setdefault(currency, len(currencies)))
+        salaries_from.append(float('nan') if salary_from is None else salary_from)
+        salaries_to.append(float('nan') if salary_to is None else salary_to)
+        salaries_rub.append(float('nan') if salary_rub is None else salary_rub)
+        name_data += (name or '').encode('utf-8')
+        name_offsets.append(len(name_data))
+        url_data += (url or '').encode('utf-8')
+        url_offsets.append(len(url_data))
+        for token in set(TOKEN_RE.findall((name or '').lower())):
+            postings.setdefault(token, array('I')).append(row_number)
+
+    tokens = sorted(postings)
+    token_offsets, token_data = array('q', [0]), bytearray()
+    posting_offsets, posting_rows = array('q', [0]), array('I')
+    for token in tokens:
+        token_data += token.encode('utf-8')
+        token_offsets.append(len(token_data))
+        posting_rows.extend(postings[token])
+        posting_offsets.append(len(posting_rows))
+
+    _save(path, 'vacancy_id', vacancy_ids, 'int64')
+    _save(path, 'company_code', company_codes, 'int32')
+    _save(path, 'currency_code', currency_codes, 'int16')
+    _save(path, 'salary_from', salaries_from, 'float64')
+    _save(path, 'salary_to', salaries_to, 'float64')
+    _save(path, 'salary_rub', salaries_rub, 'float64')
+    _save(path, 'name_offsets', name_offsets, 'int64')
+    _save(path, 'name_data', name_data, 'uint8')
+    _save(path, 'url_offsets', url_offsets, 'int64')
+    _save(path, 'url_data', url_data, 'uint8')
+    _save(path, 'token_offsets', token_offsets, 'int64')
+    _save(path, 'token_data', token_data, 'uint8')
+    _save(path, 'posting_offsets', posting_offsets, 'int64')
+    _save(path, 'postings', posting_rows, 'uint32')
+
+    meta = {
+        'version': SNAPSHOT_VERSION,
+        'created_at': datetime.now(timezone.utc).isoformat(),
+        'rows': len(vacancy_ids),
+        'companies': [[company_id, name] for company_id, name in companies.items()],
+        'currencies': sorted(currencies, key=currencies.__getitem__),
+    }
+    with open(os.path.join(path, 'meta.json'), 'w', encoding='utf-8') as f:
+        json.dump(meta, f, ensure_ascii=False)
+    return len(vacancy_ids)
+
+
+class SnapshotDB:
+    """
+    Только читающая замена DBManager поверх снимка create_snapshot: колонки отображаются в память
+    (mmap), запросы выполняются векторными операциями numpy без подключения к Postgres
+    """
+
+    def __init__(self, path: str) -> None:
+        """
+        path - каталог снимка
+        """
+        _require_numpy()
+        with open(os.path.join(path, 'meta.json'), encoding='utf-8') as f:
+            self.meta: Dict = json.load(f)
+        if self.meta.get('version') != SNAPSHOT_VERSION:
+            raise ValueError(f"Неподдерживаемая версия снимка: {self.meta.get('version')}")
+        self.columns: Dict[str, 'numpy.ndarray'] = {
+            name: numpy.load(os.path.join(path, f'{name}.npy'), mmap_mode='r') for name in COLUMNS
+        }
+        self.company_names: List[str] = [name for _, name in self.meta['companies']]
+        self.currencies: List[str] = self.meta['currencies']
+        token_offsets = self.columns['token_offsets']
+        token_data = self.columns['token_data'].tobytes()
+        # словарь слов небольшой - держим его в памяти как массив строк для numpy.char
+        self.tokens = numpy.array(
+            [token_data[token_offsets[i]:token_offsets[i + 1]].decode('utf-8') for i in range(len(token_offsets) - 1)],
+            dtype=str
+        )
+
+    def _rows(self, rows: 'numpy.ndarray') -> List[Tuple[str, str, str, str]]:
+        """
+        Собирает строки результата (компания, вакансия, зарплата, ссылка) для номеров строк rows
+        """
+        columns = self.columns
+        salaries_from = columns['salary_from'][rows].tolist()
+        salaries_to = columns['salary_to'][rows].tolist()
+        company_codes = columns['company_code'][rows].tolist()
+        name_starts = columns['name_offsets'][rows].tolist()
+        name_ends = columns['name_offsets'][rows + 1].tolist()
+        url_starts = columns['url_offsets'][rows].tolist()
+        url_ends = columns['url_offsets'][rows + 1].tolist()
+        names = columns['name_data'].data
+        urls = columns['url_data'].data
+        result = []
+        for i in range(len(rows)):
+            # NaN - единственное значение, не равное самому себе
+            salary_from = salaries_from[i] if salaries_from[i] == salaries_from[i] else None
+            salary_to = salaries_to[i] if salaries_to[i] == salaries_to[i] else None
+            result.append((
+                self.company_names[company_codes[i]],
+                str(names[name_starts[i]:name_ends[i]], 'utf-8'),
+                format_salary(salary_from, salary_to),
+                str(urls[url_starts[i]:url_ends[i]], 'utf-8'),
+            ))
+        return result
+
+    def get_companies_and_vacancies_count(self) -> List[Tuple[str, int]]:
+        """
+        Возвращает список кортежей с названием компании и количеством вакансий
+        """
+        counts = numpy.bincount(self.columns['company_code'], minlength=len(self.company_names))
+        return sorted(zip(self.company_names, counts.tolist()))
+
+    def get_all_vacancies(self) -> List[Tuple[str, str, str, str]]:
+        """
+        Возвращает все вакансии с информацией о компании и зарплате
+        """
+        return self._rows(numpy.arange(len(self.columns['vacancy_id'])))
+
+    def get_avg_salary(self) -> Optional[float]:
+        """
+        Возвращает среднюю зарплату в рублях по вакансиям, как DBManager
+        """
+        salaries = self.columns['salary_rub']
+        salaries = salaries[~numpy.isnan(salaries)]
+        return float(salaries.mean()) if len(salaries) else None
+
+    def get_vacancies_with_higher_salary(self) -> List[Tuple[str, str, str, str]]:
+        """
+        Возвращает вакансии, у которых зарплата в рублях выше средней
+        """
+        avg_salary = self.get_avg_salary()
+        if avg_salary is None:
+            return []
+        # сравнение с NaN дает False, поэтому вакансии без зарплаты отсеиваются сами
+        return self._rows(numpy.flatnonzero(self.columns['salary_rub'] > avg_salary))
+
+    def _word_rows(self, word: str) -> 'numpy.ndarray':
+        """
+        Номера строк вакансий, в названии которых есть слово, содержащее word, по возрастанию
+        """
+        posting_offsets = self.columns['posting_offsets']
+        postings = self.columns['postings']
+        matched_tokens = numpy.flatnonzero(numpy.char.find(self.tokens, word) >= 0)
+        word_postings = [postings[posting_offsets[i]:posting_offsets[i + 1]] for i in matched_tokens]
+        return numpy.unique(numpy.concatenate(word_postings)) if word_postings else numpy.empty(0, 'uint32')
+
+    def get_vacancies_with_keyword(
+            self,
+            keyword: str,
+            limit: Optional[int] = None,
+            offset: int = 0
+    ) -> List[Tuple[str, str, str, str]]:
+        """
+        Возвращает вакансии, в названии которых каждое слово запроса входит в какое-нибудь слово названия.
+        В отличие от DBManager без морфологии и ранжирования: результаты идут по id вакансии
+        """
+        words = TOKEN_RE.findall(keyword.lower())
+        if not words:
+            return []
+        rows = self._word_rows(words[0])
+        for word in words[1:]:
+            rows = numpy.intersect1d(rows, self._word_rows(word), assume_unique=True)
+        return self._rows(rows[offset:offset + limit if limit is not None else None])
+
+    def close(self) -> None:
+        """
+        Освобождает отображенные в память файлы
+        """
+        self.columns.clear()
@@ -0,0 +1,119 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional, Tuple
+
+from modules.api_module import DEEP_PAGINATION_LIMIT, VACANCY_MAX_AGE, APIClient, APIError
+from modules.db_module import DBManager
+from modules.jobs_module import IngestJobRunner
+
+
+class SyncEngine:
+    """
+    Инкрементальная синхронизация вакансий с hh: догружает только изменения с прошлого запуска,
+    а полные обходы выполняет через очередь заданий IngestJobRunner
+    """
+
+    def __init__(
+            self,
+            api_client: APIClient,
+            db_manager: DBManager,
+            overlap: timedelta = timedelta(minutes=10),
+            batch_size: int = 1000,
+            job_runner: Optional[IngestJobRunner] = None
+    ) -> None:
+        """
+        overlap - запас по времени при запросе изменений, чтобы не потерять вакансии на границе отметки,
+        job_runner - очередь заданий для полных обходов (по умолчанию в одном процессе)
+        """
+        self.api_client: APIClient = api_client
+        self.db_manager: DBManager = db_manager
+        self.overlap: timedelta = overlap
+        self.batch_size: int = batch_size
+        self.job_runner: IngestJobRunner = job_runner or IngestJobRunner(
+            api_client, db_manager, batch_size=batch_size
+        )
+
+    def _incremental_sync(self, company_id: int, since: datetime) -> None:
+        """
+        Загружает только вакансии, опубликованные или обновленные после отметки since
+        """
+        params = {'date_from': (since - self.overlap).isoformat(timespec='seconds')}
+        vacancies = (
+            vacancy
+            for items in self.api_client.iter_vacancy_pages(company_id, params=params, strict=True)
+            for vacancy in items
+        )
+        self.db_manager.insert_vacancies_bulk(vacancies, self.batch_size)
+
+    def _sync_company(self, company: Dict, since: datetime) -> str:
+        """
+        Инкрементально синхронизирует одну компанию. Возвращает 'incremental', если после загрузки
+        изменений число вакансий совпало с open_vacancies, 'full', если нужен полный обход, или 'failed'.
+        У компаний, где открыто больше DEEP_PAGINATION_LIMIT вакансий, счетчики не сравнятся никогда -
+        полный обход все равно увидит только часть вакансий. Они синхронизируются только изменениями,
+        а закрытые вакансии снимаются по сроку публикации VACANCY_MAX_AGE
+        """
+        company_id = int(company['id'])
+        started_at = datetime.now(timezone.utc)
+        try:
+            self._incremental_sync(company_id, since)
+        except APIError as e:
+            print(f"Синхронизация компании {company_id} не завершена: {e}")
+            return 'failed'
+        expected: Optional[int] = company.get('open_vacancies')
+        if expected is not None and expected > DEEP_PAGINATION_LIMIT:
+            self.db_manager.delete_vacancies_published_before(company_id, started_at - VACANCY_MAX_AGE)
+            self.db_manager.set_sync_state(
+                company_id, started_at, self.db_manager.count_company_vacancies(company_id)
+            )
+            return 'incremental'
+        if expected is None or self.db_manager.count_company_vacancies(company_id) != expected:
+            return 'full'
+        self.db_manager.set_sync_state(company_id, started_at, expected)
+        return 'incremental'
+
+    def sync(self, company_ids: List[int], full: bool = False) -> Dict[str, int]:
+        """
+        Синхронизирует компании и их вакансии. Для компаний с отметкой загружаются только изменения
+        с прошлой синхронизации, параллельно в api_client.max_workers потоков. Если после этого число
+        вакансий в базе разошлось с open_vacancies работодателя (часть вакансий закрылась), а также
+        для компаний без отметки или при full=True выполняется полный обход через очередь заданий -
+        он удаляет закрытые вакансии
+        """
+        # open_vacancies решает, хватит ли инкрементальной синхронизации, - профиль сверяется с сервером
+        companies = self.api_client.get_companies(company_ids, revalidate=True)
+        self.db_manager.insert_companies_bulk(companies)
+        state = self.db_manager.get_sync_state()
+
+        totals: Dict[str, int] = {'full': 0, 'incremental': 0, 'failed': 0}
+        full_ids: List[int] = []
+        incremental: List[Tuple[Dict, datetime]] = []
+        for company in companies:
+            watermark = None if full else state.get(int(company['id']))
+            if watermark is None:
+                full_ids.append(int(company['id']))
+            else:
+                incremental.append((company, watermark[0]))
+
+        if incremental:
+            with ThreadPoolExecutor(max_workers=min(self.api_client.max_workers, len(incremental))) as executor:
+                results = executor.map(lambda item: self._sync_company(*item), incremental)
+                for (company, _), result in zip(incremental, results):
+                    if result == 'full':
+                        full_ids.append(int(company['id']))
+                    else:
+                        totals[result] += 1
+
+        if full_ids:
+            print(f"Полная синхронизация компаний: {len(full_ids)}...")
+            # компаниям нужен полный обход - завершенные задания прошлых проходов ставятся заново
+            counts = self.job_runner.run(full_ids, restart=True)
+            totals['full'] = counts.get('done', 0)
+            totals['failed'] += counts.get('failed', 0)
+
+        self.db_manager.refresh_rollups()
+        print(
+            f"Синхронизация завершена: полных {totals['full']}, инкрементальных {totals['incremental']}, "
+            f"с ошибками {totals['failed']}"
+        )
+        return totals